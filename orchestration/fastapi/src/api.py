@@ -1,3 +1,4 @@
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from typing import Sequence
@@ -6,13 +7,13 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from ratelimit import RateLimitMiddleware, Rule
 
-from routers import ai_tools, submissions
+from routers import ai_tools, answer_cache, metrics, submissions
 from security import ratelimit
 from settings import settings
 from tools import llm_provider
 from tools.query_submissions import build_query_submissions_tool
-from tools.summarize_submissions import summarize
-from vector_database.session import inc_vector_store
+from tools.summarize_submissions import summarize_coalesced
+from vector_database import session
 
 API_PREFIX = "/api"
 
@@ -20,13 +21,15 @@ API_PREFIX = "/api"
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     os.environ["OPENAI_API_KEY"] = settings.llm_provider.api_key
+    # loaded before the first request instead of when it is handled
+    await asyncio.to_thread(session.warm_up)
     llm = llm_provider.get_llm()
     query_submissions_tool = build_query_submissions_tool(llm=llm)
 
     app.state.llm = llm
-    app.state.inc_vector_store = inc_vector_store
+    app.state.inc_vector_store = session.get_inc_vector_store()
     app.state.query_submission_tool = query_submissions_tool
-    app.state.summarize_submissions_tool = summarize
+    app.state.summarize_submissions_tool = summarize_coalesced
     yield
 
 
@@ -40,7 +43,10 @@ def pong():
 
 # Set rate limiting rules here
 rules: dict[str, Sequence[Rule]] = {
-    rf"^{API_PREFIX}/query-submission$": [Rule(minute=20, second=5)],
+    # the streaming endpoint shares the quota of the query submission endpoint
+    rf"^{API_PREFIX}/query-submission(/stream)?$": [
+        Rule(minute=20, second=5, zone="query-submission")
+    ],
     rf"^{API_PREFIX}/summarize-key-element$": [Rule(minute=20, second=5)],
 }
 
@@ -55,6 +61,10 @@ app.include_router(ai_tools.router, prefix=API_PREFIX, tags=["AI Tools"])
 
 app.include_router(submissions.router, prefix=API_PREFIX, tags=["Submissions"])
 
+app.include_router(answer_cache.router, prefix=API_PREFIX, tags=["Answer Cache"])
+
+app.include_router(metrics.router, prefix=API_PREFIX, tags=["Metrics"])
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors.allow_origins,
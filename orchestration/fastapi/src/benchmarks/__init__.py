@@ -0,0 +1,10 @@
+"""Benchmarks of the API and the workers, run with `python -m benchmarks.<name>`."""
+
+import logging
+
+# the package is imported before a benchmark imports the modules of the
+# application, which configure the root logger without a level
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    level=logging.INFO,
+)
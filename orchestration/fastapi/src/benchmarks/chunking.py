@@ -0,0 +1,69 @@
+"""Benchmark of the chunking of the treaty drafts.
+
+Run with `python -m benchmarks.chunking`. The text of every draft in `frontend/data`
+is split with the recursive character splitter configured like `split_document` was
+before and with the `TreatyChunker`, and the time and the number of identical chunks,
+with the same text and start offset, are reported.
+"""
+
+import logging
+import statistics
+import time
+from pathlib import Path
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from vector_database.chunking import SEPARATORS
+from vector_database.collections.inc import CHUNK_OVERLAP, CHUNK_SIZE, text_splitter
+from vector_database.pdf import PAGES_DELIMITER, iter_pages
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parents[4] / "frontend" / "data"
+REPEATS = 5
+
+
+def recursive_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        add_start_index=True,
+        strip_whitespace=True,
+        separators=SEPARATORS,
+        is_separator_regex=True,
+    )
+
+
+def timed(split, text: str) -> tuple[list[tuple[int, str]], float]:
+    """Return the chunks and the median time of splitting the text in ms."""
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        chunks = split(text)
+        times.append(time.perf_counter() - start)
+    return chunks, 1000 * statistics.median(times)
+
+
+def main() -> None:
+    splitter = recursive_splitter()
+    chunker = text_splitter()
+    logger.info("file | chars | chunks | recursive ms | chunker ms | identical chunks")
+    for path in sorted(DATA_DIR.glob("*.pdf")):
+        text = PAGES_DELIMITER.join(iter_pages(path))
+        expected, recursive_ms = timed(
+            lambda text: [
+                (doc.metadata["start_index"], doc.page_content)
+                for doc in splitter.create_documents([text])
+            ],
+            text,
+        )
+        chunks, chunker_ms = timed(chunker.split_text, text)
+        identical = len(set(expected) & set(chunks))
+        logger.info(
+            f"{path.name} | {len(text)} | {len(chunks)} | {recursive_ms:.1f} "
+            f"| {chunker_ms:.1f} | {identical}/{len(expected)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
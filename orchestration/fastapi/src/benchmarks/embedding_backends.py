@@ -0,0 +1,153 @@
+"""Benchmark of the drift and the speed of the embedding backends.
+
+Run with `python -m benchmarks.embedding_backends`. The chunks of the drafts in
+`frontend/data` and a set of questions are encoded with every backend. The vectors
+of PyTorch are the baseline of the drift, i.e. the cosine similarity of the vectors
+of a chunk and the overlap of the top k chunks of every question, which must stay
+within the tolerance for a backend to share a collection with PyTorch. The speed is
+reported as documents per second and as the latency of a single question.
+
+The drift of the backends is recorded for the model in the report of
+`settings.vector_store.backend.drift_report`, commit it with the report of the
+measurement: the "onnx" backend is only loaded when it is within the tolerance there.
+"""
+
+import json
+import logging
+import statistics
+import time
+from pathlib import Path
+
+import numpy as np
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from settings import settings
+from vector_database.collections.inc import text_splitter
+from vector_database.embedding_backends import (
+    load_embeddings,
+    read_drift_report,
+    variant_name,
+)
+from vector_database.pdf import PAGES_DELIMITER, iter_pages
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).resolve().parents[4] / "frontend" / "data"
+BACKENDS = [("torch", None), ("onnx", None), ("onnx", "avx2"), ("onnx", "avx512_vnni")]
+K = 7
+# minimum cosine similarity of every chunk vector to the one of PyTorch
+MIN_COSINE_SIMILARITY = 0.99
+# minimum overlap of the top k chunks of the questions with the ones of PyTorch
+MIN_RECALL = 0.95
+QUESTIONS = [
+    "Which countries support a cap on the production of primary plastic polymers?",
+    "What do the submissions say about financing mechanisms?",
+    "How should chemicals of concern in plastic products be regulated?",
+    "Quelles mesures sont proposées pour les produits en plastique à usage unique?",
+    "¿Qué obligaciones de presentación de informes se proponen?",
+    "What is proposed for the just transition of waste pickers?",
+    "How is extended producer responsibility defined?",
+    "Which provisions address microplastics?",
+]
+QUERY_REPEATS = 20
+
+
+def chunk_texts() -> list[str]:
+    splitter = text_splitter()
+    return [
+        chunk
+        for path in sorted(DATA_DIR.glob("*.pdf"))
+        for _, chunk in splitter.split_text(PAGES_DELIMITER.join(iter_pages(path)))
+    ]
+
+
+def normalized(vectors: list[list[float]]) -> np.ndarray:
+    array = np.asarray(vectors, dtype=np.float32)
+    return array / np.linalg.norm(array, axis=1, keepdims=True)
+
+
+def top_k(queries: np.ndarray, docs: np.ndarray) -> list[set[int]]:
+    return [set(np.argsort(-scores)[:K]) for scores in queries @ docs.T]
+
+
+def encode(
+    embeddings: HuggingFaceEmbeddings, texts: list[str]
+) -> tuple[np.ndarray, np.ndarray, float, list[float]]:
+    """Return the vectors of the chunks and the questions, the documents per second
+    and the latencies of the questions in ms."""
+    embeddings.embed_documents(["warm up"])
+    start = time.perf_counter()
+    docs = normalized(embeddings.embed_documents(texts))
+    docs_per_second = len(texts) / (time.perf_counter() - start)
+    latencies = []
+    for _ in range(QUERY_REPEATS):
+        for question in QUESTIONS:
+            start = time.perf_counter()
+            embeddings.embed_query(question)
+            latencies.append(1000 * (time.perf_counter() - start))
+    queries = normalized(embeddings.embed_documents(QUESTIONS))
+    return docs, queries, docs_per_second, latencies
+
+
+def main() -> None:
+    texts = chunk_texts()
+    logger.info(f"{len(texts)} chunks, {len(QUESTIONS)} questions")
+    logger.info(
+        "backend | docs/s | query p50 ms | query p95 ms | min cosine | mean cosine "
+        f"| recall@{K} | within tolerance"
+    )
+    baseline_docs = baseline_top_k = None
+    drift = {}
+    for backend, quantization in BACKENDS:
+        label = variant_name(backend, quantization)
+        try:
+            # without the drift report, which this benchmark writes
+            embeddings = load_embeddings(
+                model_name=settings.vector_store.model,
+                backend=backend,
+                quantization=quantization,
+                export_dir=settings.vector_store.backend.export_dir,
+            )
+        except ImportError as e:
+            logger.warning(f"Skipping {label}: {e}")
+            continue
+        docs, queries, docs_per_second, latencies = encode(embeddings, texts)
+        latencies.sort()
+        results = top_k(queries, docs)
+        if baseline_docs is None:
+            baseline_docs, baseline_top_k = docs, results
+        cosines = np.sum(docs * baseline_docs, axis=1)
+        recall = statistics.mean(
+            len(result & baseline) / K
+            for result, baseline in zip(results, baseline_top_k)  # type: ignore
+        )
+        within_tolerance = (
+            cosines.min() >= MIN_COSINE_SIMILARITY and recall >= MIN_RECALL
+        )
+        logger.info(
+            f"{label} | {docs_per_second:.1f} "
+            f"| {latencies[len(latencies) // 2]:.1f} "
+            f"| {latencies[int(0.95 * (len(latencies) - 1))]:.1f} "
+            f"| {cosines.min():.4f} | {cosines.mean():.4f} | {recall:.3f} "
+            f"| {within_tolerance}"
+        )
+        if backend != "torch":
+            drift[label] = {
+                "min_cosine": round(float(cosines.min()), 4),
+                "mean_cosine": round(float(cosines.mean()), 4),
+                f"recall@{K}": round(recall, 3),
+                "within_tolerance": bool(within_tolerance),
+            }
+
+    if not drift:
+        logger.warning("No onnx backend was measured, the drift report is unchanged.")
+        return
+    path = settings.vector_store.backend.drift_report
+    report = read_drift_report(path)
+    report.setdefault(settings.vector_store.model, {}).update(drift)
+    path.write_text(json.dumps(report, indent=2, sort_keys=True) + "\n")
+    logger.info(f"Drift of {', '.join(drift)} written to {path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of the query encoding throughput with and without micro-batching.
+
+Run with `python -m benchmarks.embedding_batching`. Every concurrency level encodes
+the same number of distinct questions, once by calling the embedding model per
+question from a thread pool and once through the `EmbeddingBatcher`.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_huggingface import HuggingFaceEmbeddings
+
+from settings import settings
+from vector_database.query_embeddings import EmbeddingBatcher
+
+logger = logging.getLogger(__name__)
+
+CONCURRENCY_LEVELS = [1, 4, 16, 64]
+QUERIES_PER_LEVEL = 256
+
+
+def questions(count: int, offset: int) -> list[str]:
+    return [
+        f"What do the submissions say about production caps in case {offset + i}?"
+        for i in range(count)
+    ]
+
+
+def unbatched(
+    embeddings: HuggingFaceEmbeddings, concurrency: int, offset: int
+) -> float:
+    texts = questions(QUERIES_PER_LEVEL, offset)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(embeddings.embed_query, texts))
+    return QUERIES_PER_LEVEL / (time.perf_counter() - start)
+
+
+def batched(batcher: EmbeddingBatcher, concurrency: int, offset: int) -> float:
+    texts = questions(QUERIES_PER_LEVEL, offset)
+
+    async def user(texts: list[str]) -> None:
+        for text in texts:
+            await batcher.aembed(text)
+
+    async def run() -> None:
+        await asyncio.gather(*[user(texts[i::concurrency]) for i in range(concurrency)])
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    return QUERIES_PER_LEVEL / (time.perf_counter() - start)
+
+
+def main() -> None:
+    embeddings = HuggingFaceEmbeddings(
+        model_name=settings.vector_store.model,
+        model_kwargs={"device": "cpu"},
+    )
+    batcher = EmbeddingBatcher(
+        embeddings=embeddings,
+        max_batch_size=settings.vector_store.embedding_batch_max_size,
+        max_wait_ms=settings.vector_store.embedding_batch_max_wait_ms,
+    )
+    embeddings.embed_query("warm up")
+
+    logger.info("concurrency | unbatched queries/s | batched queries/s")
+    for level, concurrency in enumerate(CONCURRENCY_LEVELS):
+        offset = 2 * level * QUERIES_PER_LEVEL
+        unbatched_qps = unbatched(embeddings, concurrency, offset)
+        batched_qps = batched(batcher, concurrency, offset + QUERIES_PER_LEVEL)
+        logger.info(
+            f"{concurrency:>11} | {unbatched_qps:>19.1f} | {batched_qps:>17.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark of the chunk ingestion throughput with and without pipelining.
+
+Run with `python -m benchmarks.ingestion`. A document of the size of a compilation
+draft is ingested into a scratch collection, once with `add_documents` of the
+langchain vector store and once with the pipelined `embed_and_upload`.
+"""
+
+import logging
+import time
+import uuid
+
+from langchain_core.documents import Document
+from langchain_qdrant import QdrantVectorStore
+from qdrant_client.models import Distance, VectorParams
+
+from vector_database.collections.inc import embed_and_upload
+from vector_database.session import get_client, get_embeddings
+
+logger = logging.getLogger(__name__)
+
+COLLECTION_NAME = "inc-benchmark"
+CHUNK_COUNTS = [50, 200, 800]
+
+
+def chunks(count: int) -> list[Document]:
+    return [
+        Document(
+            page_content=(
+                f"Article {i} | Parties shall take measures to reduce the production "
+                f"of primary plastic polymers, as set out in paragraph {i}. " * 8
+            ),
+            metadata={"retriever_id": "benchmark", "href": "", "start_index": i},
+        )
+        for i in range(count)
+    ]
+
+
+def recreate_collection() -> None:
+    if get_client().collection_exists(COLLECTION_NAME):
+        get_client().delete_collection(COLLECTION_NAME)
+    get_client().create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=VectorParams(size=512, distance=Distance.COSINE),
+    )
+
+
+def add_documents(docs: list[Document]) -> float:
+    recreate_collection()
+    vector_store = QdrantVectorStore(
+        client=get_client(), collection_name=COLLECTION_NAME, embedding=get_embeddings()
+    )
+    start = time.perf_counter()
+    vector_store.add_documents(docs, ids=[str(uuid.uuid4()) for _ in docs])
+    return len(docs) / (time.perf_counter() - start)
+
+
+def pipelined(docs: list[Document]) -> float:
+    recreate_collection()
+    start = time.perf_counter()
+    embed_and_upload(
+        docs, [str(uuid.uuid4()) for _ in docs], collection_name=COLLECTION_NAME
+    )
+    return len(docs) / (time.perf_counter() - start)
+
+
+def main() -> None:
+    get_embeddings().embed_documents(["warm up"])
+    logger.info("chunks | add_documents chunks/s | pipelined chunks/s")
+    try:
+        for count in CHUNK_COUNTS:
+            docs = chunks(count)
+            add_documents_cps = add_documents(docs)
+            pipelined_cps = pipelined(docs)
+            logger.info(
+                f"{count:>6} | {add_documents_cps:>23.1f} | {pipelined_cps:>18.1f}"
+            )
+    finally:
+        get_client().delete_collection(COLLECTION_NAME)
+
+
+if __name__ == "__main__":
+    main()
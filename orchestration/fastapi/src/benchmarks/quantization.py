@@ -0,0 +1,117 @@
+"""Benchmark of the recall and latency of the approximate search in the inc collection.
+
+Run with `python -m benchmarks.quantization`. Stored chunk vectors serve as queries.
+The result of an exact search is the baseline for the recall@k of every combination
+of `hnsw_ef`, quantization oversampling and rescoring, so that the index settings of
+`settings.vector_store` can be checked before a collection is promoted.
+"""
+
+import logging
+import random
+import statistics
+import time
+
+from qdrant_client.models import QuantizationSearchParams, SearchParams
+
+from settings import settings
+from vector_database.session import get_client
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT = 200
+K = 7
+HNSW_EFS = [16, 32, 64, 128]
+OVERSAMPLINGS = [1.0, 2.0, 3.0]
+
+
+def sample_queries(collection_name: str) -> list[list[float]]:
+    points, _ = get_client().scroll(
+        collection_name=collection_name,
+        limit=10 * QUERY_COUNT,
+        with_payload=False,
+        with_vectors=True,
+    )
+    sampled = random.Random(0).sample(points, min(QUERY_COUNT, len(points)))
+    # collections with sparse vectors return the named vectors, the dense one unnamed
+    return [
+        point.vector[""] if isinstance(point.vector, dict) else point.vector  # type: ignore
+        for point in sampled
+    ]
+
+
+def search(
+    collection_name: str, queries: list[list[float]], search_params: SearchParams
+) -> tuple[list[set], list[float]]:
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        response = get_client().query_points(
+            collection_name=collection_name,
+            query=query,
+            limit=K,
+            search_params=search_params,
+            with_payload=False,
+        )
+        latencies.append(time.perf_counter() - start)
+        results.append({point.id for point in response.points})
+    return results, latencies
+
+
+def report(
+    label: str,
+    baseline: list[set],
+    results: list[set],
+    latencies: list[float],
+) -> None:
+    recall = statistics.mean(
+        len(result & expected) / len(expected) if expected else 1.0
+        for result, expected in zip(results, baseline)
+    )
+    ordered = sorted(latencies)
+    logger.info(
+        f"{label:<38} | {recall:>9.3f} | "
+        f"{1000 * ordered[len(ordered) // 2]:>8.1f} | "
+        f"{1000 * ordered[int(0.95 * (len(ordered) - 1))]:>8.1f}"
+    )
+
+
+def main() -> None:
+    collection_name = settings.vector_store.collection
+    queries = sample_queries(collection_name)
+    logger.info(f"{len(queries)} queries against {collection_name}, recall@{K}.")
+    baseline, latencies = search(collection_name, queries, SearchParams(exact=True))
+
+    logger.info(f"{'search params':<38} | {f'recall@{K}':>9} | p50 (ms) | p95 (ms)")
+    report("exact", baseline, baseline, latencies)
+    for hnsw_ef in HNSW_EFS:
+        results, latencies = search(
+            collection_name,
+            queries,
+            SearchParams(
+                hnsw_ef=hnsw_ef,
+                quantization=QuantizationSearchParams(ignore=True),
+            ),
+        )
+        report(f"ef={hnsw_ef} original vectors", baseline, results, latencies)
+        for oversampling in OVERSAMPLINGS:
+            for rescore in [False, True]:
+                results, latencies = search(
+                    collection_name,
+                    queries,
+                    SearchParams(
+                        hnsw_ef=hnsw_ef,
+                        quantization=QuantizationSearchParams(
+                            rescore=rescore, oversampling=oversampling
+                        ),
+                    ),
+                )
+                report(
+                    f"ef={hnsw_ef} oversampling={oversampling} rescore={rescore}",
+                    baseline,
+                    results,
+                    latencies,
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Benchmark of the startup time of the entry points.
+
+Run with `python -m benchmarks.startup`. Every entry point is imported in a fresh
+interpreter, which reports the time of the import, the time of warming up the vector
+database where the entry point does it, i.e. in the lifespan of the API and when a
+worker process starts, and its peak RSS.
+"""
+
+import json
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = Path(__file__).resolve().parents[1]
+# entry point, modules imported by it and whether it warms up the vector database
+ENTRY_POINTS = [
+    ("api", ["api"], True),
+    ("worker", ["worker", "tasks.augment", "tasks.embed", "tasks.synchronize"], True),
+    ("scripts.create_collections", ["scripts.create_collections"], False),
+    ("scripts.reindex", ["scripts.reindex"], False),
+]
+REPEATS = 3
+
+CHILD = """
+import importlib, json, resource, sys, time
+
+start = time.perf_counter()
+for module in sys.argv[1].split(","):
+    importlib.import_module(module)
+import_seconds = time.perf_counter() - start
+warm_up_seconds = None
+if sys.argv[2] == "1":
+    from vector_database import session
+
+    start = time.perf_counter()
+    session.warm_up()
+    warm_up_seconds = time.perf_counter() - start
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "warm_up_seconds": warm_up_seconds,
+    "rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def measure(modules: list[str], warm_up: bool) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD, ",".join(modules), "1" if warm_up else "0"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main() -> None:
+    logger.info("entry point | import s | warm up s | peak RSS MiB")
+    for name, modules, warm_up in ENTRY_POINTS:
+        runs = [measure(modules, warm_up) for _ in range(REPEATS)]
+        best = min(runs, key=lambda run: run["import_seconds"])
+        warm_up_seconds = (
+            "-" if best["warm_up_seconds"] is None else f"{best['warm_up_seconds']:.2f}"
+        )
+        logger.info(
+            f"{name} | {best['import_seconds']:.2f} | {warm_up_seconds} "
+            f"| {best['rss_mib']:.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Redis backed cache for the answers of the query submissions tool.
+
+Every cached answer is tagged with the retriever ids it was generated from, so that
+the entries can be invalidated as soon as one of the referenced submissions changes.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import unicodedata
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from cache.session import get_async_redis_client, redis_client
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+KEY_PREFIX = "answer-cache"
+# Tag for answers which were generated without a retriever id filter
+ALL_SUBMISSIONS = "__all__"
+
+
+def normalize_question(question: str) -> str:
+    """Normalize a question so that trivially different spellings share a cache entry.
+
+    Parameters
+    ----------
+    question : str
+        The question as submitted by the user.
+
+    Returns
+    -------
+    str
+        The case folded question with collapsed whitespace and without trailing
+        punctuation.
+    """
+    question = unicodedata.normalize("NFKC", question).casefold()
+    question = re.sub(r"\s+", " ", question).strip()
+    return question.rstrip("?!. ")
+
+
+def hash_submission_metadata(submission_metadata: dict[str, Any] | None) -> str:
+    serialized = json.dumps(
+        submission_metadata or {}, sort_keys=True, ensure_ascii=False
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def normalize_filters(filters: dict[str, list[str]] | None) -> dict[str, list[str]]:
+    """Drop empty filter fields and ignore the order of the values."""
+    return {
+        field: sorted(set(values))
+        for field, values in sorted((filters or {}).items())
+        if values
+    }
+
+
+def build_cache_key(
+    question: str,
+    retriever_ids: list[str] | None,
+    submission_metadata: dict[str, Any] | None,
+    filters: dict[str, list[str]] | None = None,
+) -> str:
+    """Build the cache key for a question and its retriever id filter.
+
+    Parameters
+    ----------
+    question : str
+        The question as submitted by the user.
+    retriever_ids : list[str] | None
+        The retriever ids used in the `MatchAny` filter, None if the whole
+        collection is searched.
+    submission_metadata : dict[str, Any] | None
+        The submission metadata which is passed into the prompt.
+    filters : dict[str, list[str]] | None
+        The session, author, topic and document type filters.
+
+    Returns
+    -------
+    str
+        The redis key of the cache entry.
+    """
+    raw_key = json.dumps(
+        {
+            "question": normalize_question(question),
+            "retriever_ids": sorted(set(retriever_ids or [])),
+            "submission_metadata": hash_submission_metadata(submission_metadata),
+            "filters": normalize_filters(filters),
+        },
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:answer:{digest}"
+
+
+def _tag_key(retriever_id: str) -> str:
+    return f"{KEY_PREFIX}:retriever:{retriever_id}"
+
+
+def _tags(retriever_ids: list[str] | None) -> list[str]:
+    if not retriever_ids:
+        return [_tag_key(ALL_SUBMISSIONS)]
+    return [_tag_key(retriever_id) for retriever_id in set(retriever_ids)]
+
+
+def _invalidated_tags(retriever_ids: list[str]) -> list[str]:
+    # answers over the whole collection depend on every submission
+    return [_tag_key(retriever_id) for retriever_id in set(retriever_ids)] + [
+        _tag_key(ALL_SUBMISSIONS)
+    ]
+
+
+async def aget(key: str) -> dict[str, Any] | None:
+    if not settings.answer_cache.enabled:
+        return None
+    try:
+        value = await get_async_redis_client().get(key)
+    except RedisError as e:
+        logger.warning(f"Answer cache lookup failed: {e}")
+        return None
+    if value is None:
+        return None
+    return json.loads(value)
+
+
+async def aset(
+    key: str, value: dict[str, Any], retriever_ids: list[str] | None
+) -> None:
+    if not settings.answer_cache.enabled:
+        return None
+    ttl = settings.answer_cache.ttl
+    try:
+        async with get_async_redis_client().pipeline(transaction=True) as pipe:
+            pipe.set(key, json.dumps(value, ensure_ascii=False), ex=ttl)
+            for tag in _tags(retriever_ids):
+                pipe.sadd(tag, key)
+                pipe.expire(tag, ttl)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Answer cache write failed: {e}")
+
+
+async def ainvalidate(retriever_ids: list[str]) -> None:
+    """Remove all cached answers that reference one of the retriever ids."""
+    tags = _invalidated_tags(retriever_ids)
+    try:
+        keys: set[bytes] = set()
+        for tag in tags:
+            keys.update(await get_async_redis_client().smembers(tag))
+        await get_async_redis_client().delete(*tags, *keys)
+    except RedisError as e:
+        logger.error(f"Answer cache invalidation failed for {retriever_ids}: {e}")
+
+
+def invalidate(retriever_ids: list[str]) -> None:
+    """Synchronous variant of `ainvalidate` for the celery workers."""
+    tags = _invalidated_tags(retriever_ids)
+    try:
+        keys: set[bytes] = set()
+        for tag in tags:
+            keys.update(redis_client.smembers(tag))  # type: ignore
+        redis_client.delete(*tags, *keys)
+    except RedisError as e:
+        logger.error(f"Answer cache invalidation failed for {retriever_ids}: {e}")
@@ -0,0 +1,117 @@
+"""On-disk cache of the text and chunks parsed from PDF files.
+
+The same file is parsed again whenever a submission is embedded again, e.g. after its
+`verified` flag is toggled or when the collection is rebuilt. The parsed text and
+the chunks are cached by the SHA-256 of the content of the file and the version of
+the parser, so that unchanged files are not parsed at all and a new parser never
+reads the results of an old one. The chunks are cached without the metadata of the
+submission, which is added again on every use.
+
+Every entry is a gzipped JSON file in `settings.parse_cache.directory`, which the
+worker processes of a host share. Entries are written atomically, their
+modification time is updated on every hit, and the least recently used ones are
+evicted when the directory exceeds `settings.parse_cache.max_size_mb`.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+SUFFIX = ".json.gz"
+
+
+class ParsedDocument(NamedTuple):
+    text: str
+    # start offset in the text and content of every chunk
+    chunks: list[tuple[int, str]]
+
+
+def build_cache_key(pdf_bytes: bytes, parser_version: str) -> str:
+    digest = hashlib.sha256(pdf_bytes).hexdigest()
+    version = hashlib.sha256(parser_version.encode("utf-8")).hexdigest()[:16]
+    return f"{digest}-{version}"
+
+
+def _path(key: str) -> Path:
+    return settings.parse_cache.directory / f"{key}{SUFFIX}"
+
+
+def get(key: str) -> ParsedDocument | None:
+    """Return the cached document, None if it is not cached."""
+    if not settings.parse_cache.enabled:
+        return None
+    path = _path(key)
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            entry = json.load(file)
+        # the modification time orders the entries for the eviction
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Parse cache lookup failed for {key}: {e}")
+        return None
+    return ParsedDocument(
+        text=entry["text"],
+        chunks=[(start, chunk) for start, chunk in entry["chunks"]],
+    )
+
+
+def put(key: str, document: ParsedDocument) -> None:
+    """Cache a parsed document and evict the least recently used entries."""
+    if not settings.parse_cache.enabled:
+        return None
+    directory = settings.parse_cache.directory
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # written to a temporary file first, so no process reads a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with (
+                os.fdopen(fd, "wb") as raw,
+                gzip.open(raw, "wt", encoding="utf-8") as file,
+            ):
+                json.dump(
+                    {"text": document.text, "chunks": document.chunks},
+                    file,
+                    ensure_ascii=False,
+                )
+            os.replace(tmp_path, _path(key))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        evict()
+    except OSError as e:
+        logger.warning(f"Parse cache write failed for {key}: {e}")
+
+
+def evict() -> None:
+    """Remove the least recently used entries beyond the maximum size."""
+    max_size = settings.parse_cache.max_size_mb * 1024 * 1024
+    entries = []
+    for path in settings.parse_cache.directory.glob(f"*{SUFFIX}"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            # evicted by another process
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        logger.info(f"Evicted {path.name} from the parse cache.")
@@ -0,0 +1,121 @@
+"""Short lived cache of the chunks retrieved for the key elements of a submission.
+
+The augmentation tasks of the articles of a submission search the same submission,
+often for the same key elements, and retries repeat the searches of the failed
+attempt. The retrieved chunks are cached per retriever id and query, so that these
+searches neither encode the query nor query Qdrant again. The entries are tagged
+with the retriever id like the answers in `cache.answers` and are invalidated as
+soon as the chunks of the submission change.
+"""
+
+import hashlib
+import json
+import logging
+
+from langchain_core.documents import Document
+from redis.exceptions import RedisError
+
+from cache.session import get_async_redis_client, redis_client
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+KEY_PREFIX = "retrieval-cache"
+
+
+def build_cache_key(retriever_id: str, query: str, k: int) -> str:
+    raw_key = json.dumps(
+        {
+            "query": query,
+            "k": k,
+            # the chunks depend on how they are searched
+            "rerank": settings.rerank.enabled,
+            "hybrid_search": settings.vector_store.sparse.hybrid_search,
+        },
+        ensure_ascii=False,
+    )
+    digest = hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+    return f"{KEY_PREFIX}:chunks:{retriever_id}:{digest}"
+
+
+def _tag_key(retriever_id: str) -> str:
+    return f"{KEY_PREFIX}:retriever:{retriever_id}"
+
+
+async def aget_many(
+    retriever_id: str, queries: list[str], k: int
+) -> list[list[Document] | None]:
+    """Return the cached chunks of every query, None for the queries not cached."""
+    if not settings.retrieval_cache.enabled or not queries:
+        return [None] * len(queries)
+    try:
+        values = await get_async_redis_client().mget(
+            [build_cache_key(retriever_id, query, k) for query in queries]
+        )
+    except RedisError as e:
+        logger.warning(f"Retrieval cache lookup failed: {e}")
+        return [None] * len(queries)
+    return [
+        None if value is None else [Document(**doc) for doc in json.loads(value)]
+        for value in values
+    ]
+
+
+async def aset_many(
+    retriever_id: str, results: dict[str, list[Document]], k: int
+) -> None:
+    """Cache the chunks retrieved for every query."""
+    if not settings.retrieval_cache.enabled or not results:
+        return None
+    ttl = settings.retrieval_cache.ttl
+    try:
+        async with get_async_redis_client().pipeline(transaction=True) as pipe:
+            for query, docs in results.items():
+                key = build_cache_key(retriever_id, query, k)
+                pipe.set(
+                    key,
+                    json.dumps(
+                        [
+                            {"page_content": doc.page_content, "metadata": doc.metadata}
+                            for doc in docs
+                        ],
+                        ensure_ascii=False,
+                    ),
+                    ex=ttl,
+                )
+                pipe.sadd(_tag_key(retriever_id), key)
+            pipe.expire(_tag_key(retriever_id), ttl)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Retrieval cache write failed: {e}")
+
+
+async def ainvalidate(retriever_ids: list[str]) -> None:
+    """Remove the cached chunks of the submissions, called when they change."""
+    tags = [_tag_key(retriever_id) for retriever_id in set(retriever_ids)]
+    if not tags:
+        return None
+    try:
+        keys: set[bytes] = set()
+        for tag in tags:
+            keys.update(await get_async_redis_client().smembers(tag))
+        await get_async_redis_client().delete(*tags, *keys)
+    except RedisError as e:
+        logger.error(f"Retrieval cache invalidation failed for {retriever_ids}: {e}")
+
+
+def invalidate(retriever_ids: list[str]) -> None:
+    """Synchronous variant of `ainvalidate` for the celery workers."""
+    tags = [_tag_key(retriever_id) for retriever_id in set(retriever_ids)]
+    if not tags:
+        return None
+    try:
+        keys: set[bytes] = set()
+        for tag in tags:
+            keys.update(redis_client.smembers(tag))  # type: ignore
+        redis_client.delete(*tags, *keys)
+    except RedisError as e:
+        logger.error(f"Retrieval cache invalidation failed for {retriever_ids}: {e}")
@@ -0,0 +1,283 @@
+"""Near-duplicate tier of the answer cache.
+
+The embeddings of answered questions are stored in a small dedicated Qdrant
+collection. A new question reuses a cached answer if a stored question with an
+identical retriever id filter is more similar than the configured threshold. The
+points only reference the exact cache entries in Redis, hence an invalidated or
+expired answer is never served from this tier.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+from typing import Any
+
+from qdrant_client.models import (
+    FieldCondition,
+    Filter,
+    FilterSelector,
+    MatchAny,
+    MatchValue,
+    PointStruct,
+)
+from redis.exceptions import RedisError
+
+from cache import answers as answer_cache
+from cache.session import get_async_redis_client
+from settings import settings
+from vector_database.session import get_client, get_embeddings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+STATS_KEY = f"{answer_cache.KEY_PREFIX}:semantic:stats"
+AUDIT_KEY = f"{answer_cache.KEY_PREFIX}:semantic:audit"
+
+
+def build_filter_key(
+    retriever_ids: list[str] | None,
+    submission_metadata: dict[str, Any] | None,
+    filters: dict[str, list[str]] | None = None,
+) -> str:
+    """Identify the filters and the prompt metadata of a question."""
+    raw_key = json.dumps(
+        {
+            "retriever_ids": sorted(set(retriever_ids or [])),
+            "submission_metadata": answer_cache.hash_submission_metadata(
+                submission_metadata
+            ),
+            "filters": answer_cache.normalize_filters(filters),
+        }
+    )
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+async def _increment(*fields: str) -> None:
+    try:
+        async with get_async_redis_client().pipeline(transaction=False) as pipe:
+            for field in fields:
+                pipe.hincrby(STATS_KEY, field, 1)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Semantic cache statistics update failed: {e}")
+
+
+async def _audit(question: str, matched_question: str, score: float, key: str) -> None:
+    entry = {
+        "id": uuid.uuid4().hex,
+        "question": question,
+        "matched_question": matched_question,
+        "score": score,
+        "cache_key": key,
+        "timestamp": time.time(),
+    }
+    try:
+        async with get_async_redis_client().pipeline(transaction=True) as pipe:
+            pipe.lpush(AUDIT_KEY, json.dumps(entry, ensure_ascii=False))
+            pipe.ltrim(AUDIT_KEY, 0, settings.answer_cache.semantic_audit_size - 1)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Semantic cache audit failed: {e}")
+
+
+async def aget(
+    question: str,
+    retriever_ids: list[str] | None,
+    submission_metadata: dict[str, Any] | None,
+    filters: dict[str, list[str]] | None = None,
+) -> dict[str, Any] | None:
+    """Look up the answer of the most similar cached question.
+
+    Parameters
+    ----------
+    question : str
+        The question as submitted by the user.
+    retriever_ids : list[str] | None
+        The retriever ids used in the `MatchAny` filter.
+    submission_metadata : dict[str, Any] | None
+        The submission metadata which is passed into the prompt.
+    filters : dict[str, list[str]] | None
+        The session, author, topic and document type filters.
+
+    Returns
+    -------
+    dict[str, Any] | None
+        The cached answer or None if there is no sufficiently similar question.
+    """
+    if not (settings.answer_cache.enabled and settings.answer_cache.semantic_enabled):
+        return None
+
+    filter_key = build_filter_key(retriever_ids, submission_metadata, filters)
+    try:
+        # the raw question shares the cached embedding with the retrieval
+        vector = await get_embeddings().aembed_query(question)
+        response = await asyncio.to_thread(
+            get_client().query_points,
+            collection_name=settings.answer_cache.semantic_collection,
+            query=vector,
+            query_filter=Filter(
+                must=[
+                    FieldCondition(key="filter_key", match=MatchValue(value=filter_key))
+                ]
+            ),
+            limit=1,
+            score_threshold=settings.answer_cache.semantic_threshold,
+            with_payload=True,
+        )
+    except Exception as e:
+        logger.warning(f"Semantic cache lookup failed: {e}")
+        return None
+
+    if not response.points:
+        await _increment("lookups", "misses")
+        return None
+
+    point = response.points[0]
+    payload = point.payload or {}
+    cached_answer = await answer_cache.aget(payload["cache_key"])
+    if cached_answer is None:
+        # the referenced answer was invalidated or has expired
+        await _increment("lookups", "misses", "stale")
+        return None
+
+    await _increment("lookups", "hits")
+    await _audit(
+        question=question,
+        matched_question=payload.get("question", ""),
+        score=point.score,
+        key=payload["cache_key"],
+    )
+    return cached_answer
+
+
+async def aset(
+    key: str,
+    question: str,
+    retriever_ids: list[str] | None,
+    submission_metadata: dict[str, Any] | None,
+    filters: dict[str, list[str]] | None = None,
+) -> None:
+    """Store the question embedding pointing to the exact cache entry `key`."""
+    if not (settings.answer_cache.enabled and settings.answer_cache.semantic_enabled):
+        return None
+    normalized_question = answer_cache.normalize_question(question)
+    try:
+        vector = await get_embeddings().aembed_query(question)
+        await asyncio.to_thread(
+            get_client().upsert,
+            collection_name=settings.answer_cache.semantic_collection,
+            points=[
+                PointStruct(
+                    id=str(uuid.uuid5(uuid.NAMESPACE_URL, key)),
+                    vector=vector,
+                    payload={
+                        "cache_key": key,
+                        "question": normalized_question,
+                        "filter_key": build_filter_key(
+                            retriever_ids, submission_metadata, filters
+                        ),
+                        "retriever_ids": retriever_ids
+                        or [answer_cache.ALL_SUBMISSIONS],
+                    },
+                )
+            ],
+        )
+    except Exception as e:
+        logger.warning(f"Semantic cache write failed: {e}")
+
+
+def _invalidation_selector(retriever_ids: list[str]) -> FilterSelector:
+    return FilterSelector(
+        filter=Filter(
+            must=[
+                FieldCondition(
+                    key="retriever_ids",
+                    match=MatchAny(
+                        any=list(retriever_ids) + [answer_cache.ALL_SUBMISSIONS]
+                    ),
+                )
+            ]
+        )
+    )
+
+
+async def ainvalidate(retriever_ids: list[str]) -> None:
+    try:
+        await asyncio.to_thread(
+            get_client().delete,
+            collection_name=settings.answer_cache.semantic_collection,
+            points_selector=_invalidation_selector(retriever_ids),
+        )
+    except Exception as e:
+        logger.error(f"Semantic cache invalidation failed for {retriever_ids}: {e}")
+
+
+def invalidate(retriever_ids: list[str]) -> None:
+    """Synchronous variant of `ainvalidate` for the celery workers."""
+    try:
+        get_client().delete(
+            collection_name=settings.answer_cache.semantic_collection,
+            points_selector=_invalidation_selector(retriever_ids),
+        )
+    except Exception as e:
+        logger.error(f"Semantic cache invalidation failed for {retriever_ids}: {e}")
+
+
+async def astats() -> dict[str, Any]:
+    """Hit rate and audit counters of the semantic tier, zero if Redis is down."""
+    try:
+        raw_stats = await get_async_redis_client().hgetall(STATS_KEY)
+    except RedisError as e:
+        logger.warning(f"Semantic cache statistics lookup failed: {e}")
+        raw_stats = {}
+    stats = {key.decode(): int(value) for key, value in raw_stats.items()}
+    lookups, hits = stats.get("lookups", 0), stats.get("hits", 0)
+    audited, false_hits = stats.get("audited", 0), stats.get("false_hits", 0)
+    return {
+        "threshold": settings.answer_cache.semantic_threshold,
+        "lookups": lookups,
+        "hits": hits,
+        "misses": stats.get("misses", 0),
+        "stale": stats.get("stale", 0),
+        "hit_rate": hits / lookups if lookups else 0.0,
+        "audited": audited,
+        "false_hits": false_hits,
+        "false_hit_rate": false_hits / audited if audited else 0.0,
+    }
+
+
+async def aaudit_entries(limit: int) -> list[dict[str, Any]]:
+    """The most recent audited hits, none if Redis is down."""
+    try:
+        entries = await get_async_redis_client().lrange(AUDIT_KEY, 0, limit - 1)
+    except RedisError as e:
+        logger.warning(f"Semantic cache audit lookup failed: {e}")
+        return []
+    return [json.loads(entry) for entry in entries]
+
+
+async def areport_audit(audit_id: str, false_hit: bool) -> bool:
+    """Record the review of an audited hit. Returns False if the entry is unknown.
+
+    Raises
+    ------
+    RedisError
+        If Redis is down, the review can't be recorded.
+    """
+    raw_entries = await get_async_redis_client().lrange(AUDIT_KEY, 0, -1)
+    raw_entry = next(
+        (raw for raw in raw_entries if json.loads(raw)["id"] == audit_id), None
+    )
+    if raw_entry is None:
+        return False
+    if false_hit:
+        await _increment("audited", "false_hits")
+    else:
+        await _increment("audited")
+    await get_async_redis_client().lrem(AUDIT_KEY, 1, raw_entry)
+    return True
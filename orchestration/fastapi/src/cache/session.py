@@ -0,0 +1,34 @@
+import asyncio
+from weakref import WeakKeyDictionary
+
+from redis import StrictRedis
+from redis.asyncio import StrictRedis as AsyncStrictRedis
+
+from settings import settings
+
+# Synchronous client for the celery workers and scripts
+redis_client = StrictRedis(
+    host=settings.redis.host,
+    port=settings.redis.port,
+)
+
+_async_redis_clients: WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncStrictRedis] = (
+    WeakKeyDictionary()
+)
+
+
+def get_async_redis_client() -> AsyncStrictRedis:
+    """Return the asynchronous client of the running event loop.
+
+    Connections of asynchronous clients can't be shared between event loops, hence
+    every loop (e.g. of the FastAPI application or of a celery task) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_redis_clients.get(loop)
+    if client is None:
+        client = AsyncStrictRedis(
+            host=settings.redis.host,
+            port=settings.redis.port,
+        )
+        _async_redis_clients[loop] = client
+    return client
@@ -0,0 +1,200 @@
+"""Coalescing of identical concurrent requests.
+
+Within one process identical requests await the future of the first request. Across
+uvicorn workers the first request takes a Redis lock and publishes its result on a
+channel which the other workers are subscribed to. If the leader fails or does not
+answer in time, the waiting requests fall back to computing the result themselves.
+"""
+
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable
+
+from redis.exceptions import RedisError
+
+from cache.session import get_async_redis_client
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+KEY_PREFIX = "singleflight"
+# published by a leader that failed, so that the followers do not wait in vain
+FAILED = {"failed": True}
+
+
+class _LeaderCancelledError(Exception):
+    """Set on the future of a cancelled leader, its local followers compute the result
+    themselves like the remote ones."""
+
+
+class SingleFlight:
+    """Group of coalesced calls sharing a namespace.
+
+    Parameters
+    ----------
+    namespace : str
+        Prefix of the keys, to separate the different kinds of requests.
+    """
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def _key(self, key: str, suffix: str) -> str:
+        return f"{KEY_PREFIX}:{self.namespace}:{key}:{suffix}"
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn` once for all concurrent calls with the same key.
+
+        Parameters
+        ----------
+        key : str
+            Identifies identical requests, e.g. a hash of the request body.
+        fn : Callable[[], Awaitable[Any]]
+            Computes the result, which has to be JSON serializable.
+
+        Returns
+        -------
+        Any
+            The result of `fn`, possibly computed by another request.
+        """
+        if not settings.request_coalescing.enabled:
+            return await fn()
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            metrics.increment(f"singleflight.{self.namespace}.local_followers")
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelledError:
+                metrics.increment(f"singleflight.{self.namespace}.fallbacks")
+                # the followers elect a new leader among them
+                return await self.do(key, fn)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            result = await self._do_distributed(key, fn)
+        except asyncio.CancelledError:
+            # cancelling the future would cancel the followers as well
+            future.set_exception(_LeaderCancelledError())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieve the exception, in case no follower is waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._in_flight[key]
+
+    async def _do_distributed(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        lock_key = self._key(key, "lock")
+        token = uuid.uuid4().hex
+        try:
+            acquired = await get_async_redis_client().set(
+                lock_key,
+                token,
+                nx=True,
+                ex=settings.request_coalescing.lock_ttl,
+            )
+        except RedisError as e:
+            logger.warning(f"Request coalescing is not possible: {e}")
+            return await fn()
+
+        if acquired:
+            return await self._lead(key, token, fn)
+
+        result = await self._follow(key)
+        if result is None:
+            metrics.increment(f"singleflight.{self.namespace}.fallbacks")
+            return await fn()
+        metrics.increment(f"singleflight.{self.namespace}.remote_followers")
+        return result
+
+    async def _keep_lock(self, key: str) -> None:
+        # a short lock ttl which is refreshed while the leader is alive, so that the
+        # followers notice a crashed leader quickly
+        interval = settings.request_coalescing.lock_ttl / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await get_async_redis_client().expire(
+                    self._key(key, "lock"), settings.request_coalescing.lock_ttl
+                )
+            except RedisError as e:
+                logger.warning(f"Refreshing the coalescing lock failed: {e}")
+
+    async def _lead(
+        self, key: str, token: str, fn: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        metrics.increment(f"singleflight.{self.namespace}.leaders")
+        heartbeat = asyncio.create_task(self._keep_lock(key))
+        message = FAILED
+        try:
+            result = await fn()
+            message = {"result": result}
+            return result
+        finally:
+            heartbeat.cancel()
+            serialized = json.dumps(message, ensure_ascii=False)
+            try:
+                async with get_async_redis_client().pipeline(transaction=True) as pipe:
+                    # stored for followers which subscribe after the publication
+                    pipe.set(
+                        self._key(key, "result"),
+                        serialized,
+                        ex=settings.request_coalescing.result_ttl,
+                    )
+                    pipe.publish(self._key(key, "channel"), serialized)
+                    await pipe.execute()
+                if await get_async_redis_client().get(self._key(key, "lock")) == (
+                    token.encode()
+                ):
+                    await get_async_redis_client().delete(self._key(key, "lock"))
+            except RedisError as e:
+                logger.warning(f"Publishing the coalesced result failed: {e}")
+
+    async def _follow(self, key: str) -> Any | None:
+        """Wait for the result of the leader, None if it failed or timed out."""
+        redis_client = get_async_redis_client()
+        pubsub = redis_client.pubsub()
+        try:
+            await pubsub.subscribe(self._key(key, "channel"))
+            # the leader may have finished before the subscription
+            serialized = await redis_client.get(self._key(key, "result"))
+            deadline = time.monotonic() + settings.request_coalescing.wait_timeout
+            while serialized is None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    return None
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=min(timeout, 1.0)
+                )
+                if message is not None:
+                    serialized = message["data"]
+                elif not await redis_client.exists(self._key(key, "lock")):
+                    # the leader is gone, its result may have been stored meanwhile
+                    serialized = await redis_client.get(self._key(key, "result"))
+                    if serialized is None:
+                        return None
+        except RedisError as e:
+            logger.warning(f"Waiting for the coalesced result failed: {e}")
+            return None
+        finally:
+            await pubsub.aclose()
+
+        message = json.loads(serialized)
+        if message == FAILED:
+            return None
+        return message["result"]
@@ -0,0 +1,127 @@
+"""In-process counters and timings, exposed through the token protected metrics
+endpoint of the API."""
+
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class Metrics:
+    """Thread-safe registry of counters and timing observations.
+
+    Parameters
+    ----------
+    window : int
+        Number of most recent observations per timing used for the percentiles.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters: dict[str, int] = defaultdict(int)
+        self._timings: dict[str, deque[float]] = {}
+        self._timing_counts: dict[str, int] = defaultdict(int)
+        self._timing_totals: dict[str, float] = defaultdict(float)
+
+    def increment(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            if name not in self._timings:
+                self._timings[name] = deque(maxlen=self._window)
+            self._timings[name].append(seconds)
+            self._timing_counts[name] += 1
+            self._timing_totals[name] += seconds
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict[str, Any]:
+        """Return the counters and the timing summaries in seconds."""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {}
+            for name, observations in self._timings.items():
+                ordered = sorted(observations)
+                count = self._timing_counts[name]
+                timings[name] = {
+                    "count": count,
+                    "mean": self._timing_totals[name] / count,
+                    "p50": ordered[int(0.5 * (len(ordered) - 1))],
+                    "p95": ordered[int(0.95 * (len(ordered) - 1))],
+                    "max": ordered[-1],
+                }
+        return {"counters": counters, "timings": timings}
+
+
+class RSSSampler:
+    """Peak increase of the resident set size of the process over a block.
+
+    A thread samples the RSS while the block runs, so that memory which is freed
+    before its end is counted as well. Other threads of the process allocate at the
+    same time, and processes started by the block are not included. The RSS is read
+    from /proc and None where it is not available.
+
+    Parameters
+    ----------
+    interval : float
+        Seconds between the samples.
+    """
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.start_rss: int | None = None
+        self.peak_rss: int | None = None
+
+    @staticmethod
+    def rss() -> int | None:
+        """Return the current RSS of the process in bytes."""
+        try:
+            with open("/proc/self/statm") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            return None
+
+    def _sample(self) -> None:
+        rss = self.rss()
+        if rss is not None and self.peak_rss is not None:
+            self.peak_rss = max(self.peak_rss, rss)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            self._sample()
+
+    def __enter__(self) -> "RSSSampler":
+        self.start_rss = self.peak_rss = self.rss()
+        if self.start_rss is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._sample()
+
+    @property
+    def peak_increase(self) -> int | None:
+        """Return the peak RSS over the block minus the RSS at its start in bytes."""
+        if self.start_rss is None or self.peak_rss is None:
+            return None
+        return self.peak_rss - self.start_rss
+
+
+metrics = Metrics()
@@ -1,12 +1,17 @@
 import json
 import logging
-from typing import Annotated
+from typing import Annotated, Any, AsyncIterator
 
 from fastapi import APIRouter, Body, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 from qdrant_client.http.models import FieldCondition, Filter, MatchAny
 from starlette import status
 
+from cache import answers as answer_cache
+from cache import semantic as semantic_answer_cache
+from cache.singleflight import SingleFlight
+
 # ---------------------------------------------------------------------
 # -- ALL ROUTERS IN THIS FILE ARE SUPPOSED TO BE PUBLICLY ACCESSIBLE --
 # ---------------------------------------------------------------------
@@ -20,9 +25,19 @@ class SubmissionDataDetail(BaseModel):
     topics: list[str] = []
 
 
+class SubmissionFilterIn(BaseModel):
+    """Restricts the search to submissions matching any of the values of a field."""
+
+    sessions: list[str] = []
+    author_ids: list[str] = []
+    topic_ids: list[str] = []
+    document_types: list[str] = []
+
+
 class QuerySubmissionIn(BaseModel):
     question: str = Field(..., min_length=1, max_length=250)
     submission_metadata: dict[str, SubmissionDataDetail] | None = None
+    filters: SubmissionFilterIn | None = None
 
 
 class ReferencesOut(BaseModel):
@@ -34,51 +49,11 @@ class QuerySubmissionOut(BaseModel):
     answer: str
     context: dict[str, list[str]] = {}
     references: list[ReferencesOut] = []
+    cached: bool = False
 
 
-@router.post(
-    path="/query-submission",
-    response_model=QuerySubmissionOut,
-    status_code=status.HTTP_200_OK,
-)
-async def query_submission(
-    query: Annotated[QuerySubmissionIn, Body(..., description="Question to submit")],
-    Request: Request,
-) -> QuerySubmissionOut:
-    query_submissions_tool = Request.app.state.query_submission_tool
-
-    if query.submission_metadata:
-        retriever_ids = list(query.submission_metadata.keys())
-
-        doc_id_filter = Filter(
-            must=[
-                FieldCondition(
-                    key="metadata.retriever_id",
-                    match=MatchAny(any=retriever_ids),
-                )
-            ]
-        )
-
-        submission_metadata_dict = {
-            key: value.model_dump()  # Convert Pydantic object to dict
-            for key, value in query.submission_metadata.items()
-        }
-
-        response = await query_submissions_tool.ainvoke(
-            {
-                "question": query.question,
-                "filter": doc_id_filter,
-                "submission_metadata": submission_metadata_dict,
-            }
-        )
-    else:
-        response = await query_submissions_tool.ainvoke(
-            {
-                "question": query.question,
-                "submission_metadata": query.submission_metadata,
-            }
-        )
-
+def build_query_submission_out(response: dict[str, Any]) -> QuerySubmissionOut:
+    """Convert the state returned by the query submissions tool into the response."""
     answer = response["answer"]
     context: dict[str, list[str]] = {}
     for doc in response["context"]:
@@ -110,6 +85,226 @@ async def query_submission(
     )
 
 
+# payload fields of the chunks filtered by the fields of `SubmissionFilterIn`
+FILTER_PAYLOAD_KEYS = {
+    "sessions": "metadata.session",
+    "author_ids": "metadata.author_ids",
+    "topic_ids": "metadata.topic_ids",
+    "document_types": "metadata.document_type",
+}
+
+
+def build_query_input(query: QuerySubmissionIn) -> dict[str, Any]:
+    """Build the input state of the query submissions tool from the request."""
+    conditions = []
+    submission_metadata_dict = {}
+    if query.submission_metadata:
+        conditions.append(
+            FieldCondition(
+                key="metadata.retriever_id",
+                match=MatchAny(any=list(query.submission_metadata.keys())),
+            )
+        )
+        submission_metadata_dict = {
+            key: value.model_dump()  # Convert Pydantic object to dict
+            for key, value in query.submission_metadata.items()
+        }
+    if query.filters:
+        # indexed payload fields, which Qdrant applies during the HNSW search
+        for field, values in query.filters.model_dump().items():
+            if values:
+                conditions.append(
+                    FieldCondition(
+                        key=FILTER_PAYLOAD_KEYS[field], match=MatchAny(any=values)
+                    )
+                )
+
+    query_input: dict[str, Any] = {
+        "question": query.question,
+        "submission_metadata": submission_metadata_dict,
+    }
+    if conditions:
+        query_input["filter"] = Filter(must=conditions)
+    return query_input
+
+
+def filters_of(query: QuerySubmissionIn) -> dict[str, list[str]] | None:
+    if query.filters:
+        return query.filters.model_dump()
+    return None
+
+
+def retriever_ids_of(query: QuerySubmissionIn) -> list[str] | None:
+    if query.submission_metadata:
+        return list(query.submission_metadata.keys())
+    return None
+
+
+async def alookup_answer(
+    query: QuerySubmissionIn, query_input: dict[str, Any]
+) -> tuple[str, dict[str, Any] | None]:
+    """Look up the answer in the exact and the near-duplicate answer cache.
+
+    Returns
+    -------
+    tuple[str, dict[str, Any] | None]
+        The exact cache key and the cached answer, None on a cache miss.
+    """
+    cache_key = answer_cache.build_cache_key(
+        question=query.question,
+        retriever_ids=retriever_ids_of(query),
+        submission_metadata=query_input["submission_metadata"],
+        filters=filters_of(query),
+    )
+    cached_answer = await answer_cache.aget(cache_key)
+    if cached_answer is None:
+        cached_answer = await semantic_answer_cache.aget(
+            question=query.question,
+            retriever_ids=retriever_ids_of(query),
+            submission_metadata=query_input["submission_metadata"],
+            filters=filters_of(query),
+        )
+    if cached_answer is not None:
+        cached_answer["cached"] = True
+    return cache_key, cached_answer
+
+
+async def astore_answer(
+    cache_key: str,
+    query: QuerySubmissionIn,
+    query_input: dict[str, Any],
+    query_submission_out: QuerySubmissionOut,
+) -> None:
+    await answer_cache.aset(
+        cache_key,
+        query_submission_out.model_dump(),
+        retriever_ids=retriever_ids_of(query),
+    )
+    await semantic_answer_cache.aset(
+        cache_key,
+        question=query.question,
+        retriever_ids=retriever_ids_of(query),
+        submission_metadata=query_input["submission_metadata"],
+        filters=filters_of(query),
+    )
+
+
+@router.post(
+    path="/query-submission",
+    response_model=QuerySubmissionOut,
+    status_code=status.HTTP_200_OK,
+)
+async def query_submission(
+    query: Annotated[QuerySubmissionIn, Body(..., description="Question to submit")],
+    Request: Request,
+) -> QuerySubmissionOut:
+    query_submissions_tool = Request.app.state.query_submission_tool
+
+    query_input = build_query_input(query)
+    cache_key, cached_answer = await alookup_answer(query, query_input)
+    if cached_answer is not None:
+        return QuerySubmissionOut.model_validate(cached_answer)
+
+    async def answer() -> dict[str, Any]:
+        response = await query_submissions_tool.ainvoke(query_input)
+        query_submission_out = build_query_submission_out(response)
+        await astore_answer(cache_key, query, query_input, query_submission_out)
+        return query_submission_out.model_dump()
+
+    # identical questions in flight at the same time share one graph invocation
+    return QuerySubmissionOut.model_validate(
+        await query_submission_flight.do(cache_key, answer)
+    )
+
+
+query_submission_flight = SingleFlight(namespace="query-submission")
+
+
+def server_sent_event(event: str, data: dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post(
+    path="/query-submission/stream",
+    response_class=StreamingResponse,
+    status_code=status.HTTP_200_OK,
+)
+async def query_submission_stream(
+    query: Annotated[QuerySubmissionIn, Body(..., description="Question to submit")],
+    Request: Request,
+) -> StreamingResponse:
+    """
+    Stream the answer as server-sent events. A `context` event with the retrieved
+    context and references is sent as soon as the retrieval is done, followed by
+    `token` events with parts of the answer and a final `done` event.
+    """
+    query_submissions_tool = Request.app.state.query_submission_tool
+    query_input = build_query_input(query)
+
+    async def event_stream() -> AsyncIterator[str]:
+        cache_key, cached_answer = await alookup_answer(query, query_input)
+        if cached_answer is not None:
+            yield server_sent_event(
+                "context",
+                {
+                    "context": cached_answer["context"],
+                    "references": cached_answer["references"],
+                },
+            )
+            yield server_sent_event("token", {"token": cached_answer["answer"]})
+            yield server_sent_event("done", {"cached": True})
+            return
+
+        response: dict[str, Any] = {"answer": "", "context": []}
+        # the node which determines the context passed into the prompt
+        context_node = (
+            "rerank" if "rerank" in query_submissions_tool.nodes else "retrieve"
+        )
+        try:
+            async for mode, chunk in query_submissions_tool.astream(
+                query_input, stream_mode=["updates", "messages"]
+            ):
+                if mode == "messages":
+                    message_chunk, metadata = chunk
+                    if metadata.get("langgraph_node") == "generate":
+                        if message_chunk.content:
+                            yield server_sent_event(
+                                "token", {"token": message_chunk.content}
+                            )
+                    continue
+
+                if context_node in chunk:
+                    response["context"] = chunk[context_node]["context"]
+                    retrieved = build_query_submission_out(response)
+                    yield server_sent_event(
+                        "context",
+                        {
+                            "context": retrieved.context,
+                            "references": [
+                                reference.model_dump()
+                                for reference in retrieved.references
+                            ],
+                        },
+                    )
+                if "generate" in chunk:
+                    response["answer"] = chunk["generate"]["answer"]
+        except Exception as e:
+            logger.error(f"Error while streaming the answer: {e}")
+            yield server_sent_event("error", {"detail": "Answer generation failed."})
+            return
+
+        yield server_sent_event("done", {"cached": False})
+        await astore_answer(
+            cache_key, query, query_input, build_query_submission_out(response)
+        )
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 class SubmissionExtract(BaseModel):
     author: list[str]
     text: str
@@ -0,0 +1,87 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Body, Depends, HTTPException, Query
+from pydantic import BaseModel
+from redis.exceptions import RedisError
+from starlette import status
+
+from cache import semantic as semantic_answer_cache
+from security.api_token import check_api_token
+
+router = APIRouter(dependencies=[Depends(check_api_token)])
+
+
+class SemanticCacheStatsOut(BaseModel):
+    threshold: float
+    lookups: int
+    hits: int
+    misses: int
+    stale: int
+    hit_rate: float
+    audited: int
+    false_hits: int
+    false_hit_rate: float
+
+
+class SemanticCacheAuditEntry(BaseModel):
+    id: str
+    question: str
+    matched_question: str
+    score: float
+    cache_key: str
+    timestamp: float
+
+
+@router.get(
+    path="/answer-cache/semantic/stats",
+    response_model=SemanticCacheStatsOut,
+)
+async def semantic_cache_stats() -> SemanticCacheStatsOut:
+    """
+    Hit rate, threshold and audit counters of the near-duplicate answer cache.
+    """
+    return SemanticCacheStatsOut(**await semantic_answer_cache.astats())
+
+
+@router.get(
+    path="/answer-cache/semantic/audit",
+    response_model=list[SemanticCacheAuditEntry],
+)
+async def semantic_cache_audit(
+    limit: Annotated[int, Query(ge=1, le=500)] = 50,
+) -> list[SemanticCacheAuditEntry]:
+    """
+    Most recent near-duplicate hits, to be reviewed for false hits.
+    """
+    entries = await semantic_answer_cache.aaudit_entries(limit=limit)
+    return [SemanticCacheAuditEntry(**entry) for entry in entries]
+
+
+class SemanticCacheAuditIn(BaseModel):
+    audit_id: str
+    false_hit: bool
+
+
+@router.post(
+    path="/answer-cache/semantic/audit",
+    status_code=status.HTTP_204_NO_CONTENT,
+)
+async def report_semantic_cache_audit(
+    audit: Annotated[
+        SemanticCacheAuditIn, Body(..., description="Review of an audited hit")
+    ],
+) -> None:
+    """
+    Record whether an audited near-duplicate hit served a wrong answer.
+    """
+    try:
+        reported = await semantic_answer_cache.areport_audit(
+            audit_id=audit.audit_id, false_hit=audit.false_hit
+        )
+    except RedisError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="The answer cache is not available.",
+        )
+    if not reported:
+        raise HTTPException(status_code=404, detail="Audit entry not found.")
@@ -0,0 +1,16 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends
+
+from metrics import metrics
+from security.api_token import check_api_token
+
+router = APIRouter(dependencies=[Depends(check_api_token)])
+
+
+@router.get(path="/metrics")
+async def get_metrics() -> dict[str, Any]:
+    """
+    Counters and timings (in seconds) of the API process.
+    """
+    return metrics.snapshot()
@@ -1,12 +1,19 @@
+import asyncio
 from typing import Annotated
 
-from fastapi import APIRouter, Body, Depends, Request
+from fastapi import APIRouter, Body, Depends, HTTPException, Request
 from pydantic import AnyHttpUrl, BaseModel
 from qdrant_client.models import FieldCondition, Filter, MatchValue
 from starlette import status
 
+from cache import answers as answer_cache
+from cache import retrieval as retrieval_cache
+from cache import semantic as semantic_answer_cache
+from scripts.create_collections import create_inc_collection
 from security.api_token import check_api_token
-from tasks import embed, synchronize
+from settings import settings
+from tasks import embed, reindex, synchronize
+from vector_database import aliases
 
 router = APIRouter(dependencies=[Depends(check_api_token)])
 
@@ -47,6 +54,9 @@ class IncDocumentIn(BaseModel):
     href: str
     key_elements: dict[str, list[str]] | None = None
     session: str
+    author_ids: list[str] = []
+    topic_ids: list[str] = []
+    document_type: str | None = None
 
 
 class IncDocumentOut(BaseModel):
@@ -73,6 +83,9 @@ async def inc_document(
         href=document.href,
         key_elements=document.key_elements,
         session=document.session,
+        author_ids=document.author_ids,
+        topic_ids=document.topic_ids,
+        document_type=document.document_type,
     )
     return IncDocumentOut(
         message="Document processing and embedding task started successfully.",
@@ -102,4 +115,124 @@ async def delete_submission_vector(
             )
         ]
     )
-    inc_vector_store.client.delete(collection_name="inc", points_selector=delete_filter)
+    for collection_name in aliases.write_collections():
+        inc_vector_store.client.delete(
+            collection_name=collection_name, points_selector=delete_filter
+        )
+    await answer_cache.ainvalidate([retriever_id.retriever_id])
+    await semantic_answer_cache.ainvalidate([retriever_id.retriever_id])
+    await retrieval_cache.ainvalidate([retriever_id.retriever_id])
+
+
+class CollectionOut(BaseModel):
+    name: str
+    points_count: int | None = None
+    aliases: list[str] = []
+    building: bool = False
+
+
+def list_collections(client) -> list[CollectionOut]:
+    alias_names: dict[str, list[str]] = {}
+    for alias in client.get_aliases().aliases:
+        alias_names.setdefault(alias.collection_name, []).append(alias.alias_name)
+    building = aliases.building_collections()
+    return [
+        CollectionOut(
+            name=collection.name,
+            points_count=client.get_collection(collection.name).points_count,
+            aliases=alias_names.get(collection.name, []),
+            building=collection.name in building,
+        )
+        for collection in client.get_collections().collections
+        if collection.name == settings.vector_store.collection
+        or collection.name.startswith(f"{settings.vector_store.collection}-")
+    ]
+
+
+def check_physical_collection(client, collection_name: str) -> None:
+    if collection_name == settings.vector_store.collection:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"{collection_name} is the alias of the live collection.",
+        )
+    if not client.collection_exists(collection_name):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Collection {collection_name} does not exist.",
+        )
+
+
+@router.get(
+    path="/collections",
+    response_model=list[CollectionOut],
+)
+async def get_collections(Request: Request) -> list[CollectionOut]:
+    """
+    List the physical collections of the 'inc' vector store and the alias pointing
+    to the live one.
+    """
+    client = Request.app.state.inc_vector_store.client
+    return await asyncio.to_thread(list_collections, client)
+
+
+@router.post(
+    path="/collections",
+    status_code=status.HTTP_201_CREATED,
+    response_model=CollectionOut,
+)
+async def create_collection(Request: Request) -> CollectionOut:
+    """
+    Create an empty physical collection with the current settings. Until it is
+    promoted, processed and deleted submissions are written to it as well.
+    """
+    client = Request.app.state.inc_vector_store.client
+    collection_name = aliases.new_collection_name()
+    await asyncio.to_thread(create_inc_collection, client, collection_name)
+    aliases.mark_building(collection_name)
+    return CollectionOut(name=collection_name, points_count=0, building=True)
+
+
+class CollectionTaskOut(BaseModel):
+    message: str
+    task_id: str
+
+
+@router.post(
+    path="/collections/{collection_name}/populate",
+    status_code=status.HTTP_201_CREATED,
+    response_model=CollectionTaskOut,
+)
+async def populate_collection(
+    collection_name: str, Request: Request
+) -> CollectionTaskOut:
+    """
+    Spawn a background task to index all verified submissions into the collection.
+    """
+    client = Request.app.state.inc_vector_store.client
+    await asyncio.to_thread(check_physical_collection, client, collection_name)
+    task = reindex.delay(collection_name=collection_name)
+    return CollectionTaskOut(
+        message=f"Population of {collection_name} started successfully.",
+        task_id=task.id,
+    )
+
+
+@router.post(
+    path="/collections/{collection_name}/promote",
+    response_model=CollectionOut,
+)
+async def promote_collection(collection_name: str, Request: Request) -> CollectionOut:
+    """
+    Atomically switch the alias of the live collection to the collection.
+    """
+    client = Request.app.state.inc_vector_store.client
+    await asyncio.to_thread(check_physical_collection, client, collection_name)
+    try:
+        await asyncio.to_thread(aliases.promote, client, collection_name)
+    except aliases.LegacyCollectionError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return CollectionOut(
+        name=collection_name,
+        points_count=client.get_collection(collection_name).points_count,
+        aliases=[settings.vector_store.collection],
+    )
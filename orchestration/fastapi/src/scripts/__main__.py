@@ -1,18 +1,20 @@
+import argparse
 import logging
+from pathlib import Path
 
-from scripts.create_collections import create_collections
+from scripts.create_collections import create_collections, migrate_legacy_collection
 from scripts.preprocess_authors import preprocess as preprocess_authors
 from scripts.preprocess_titles import preprocess as preprocess_titles
 from scripts.preprocess_topics import preprocess as preprocess_topics
+from scripts.reindex import reindex
 from scripts.seed_database import seed_database
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Preprocessing has to start with the authors, then topics, and finally titles.
 
 
-def main():
+def setup():
     scripts = [
         preprocess_authors,
         preprocess_topics,
@@ -31,5 +33,46 @@ def main():
             raise
 
 
+def main():
+    # replaces the configuration of the imported modules, which set no level
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+        force=True,
+    )
+    parser = argparse.ArgumentParser(prog="python -m scripts")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.add_parser("setup", help="Preprocess data and seed the databases.")
+    reindex_parser = subparsers.add_parser(
+        "reindex", help="Rebuild the inc collection from PocketBase."
+    )
+    reindex_parser.add_argument(
+        "--state-file", type=Path, default=Path("reindex-state.json")
+    )
+    reindex_parser.add_argument("--workers", type=int, default=None)
+    reindex_parser.add_argument("--batch-size", type=int, default=1024)
+    migrate_parser = subparsers.add_parser(
+        "migrate-legacy-collection",
+        help="Copy the legacy inc collection and serve the copy through the alias.",
+    )
+    migrate_parser.add_argument("--collection", default=None)
+    migrate_parser.add_argument("--drop-legacy", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "migrate-legacy-collection":
+        migrate_legacy_collection(
+            collection_name=args.collection, drop_legacy=args.drop_legacy
+        )
+    elif args.command == "reindex":
+        reindex(
+            state_file=args.state_file,
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+    else:
+        # the default, as run by the scripts container on start up
+        setup()
+
+
 if __name__ == "__main__":
     main()
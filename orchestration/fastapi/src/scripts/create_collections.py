@@ -1,10 +1,29 @@
 """This script creates the necessary collections. It's intended to be run once to set up
 the vector store."""
 
+import logging
+
 from qdrant_client import QdrantClient
 from qdrant_client.http.models import Distance, VectorParams
-from qdrant_client.models import PayloadSchemaType
+from qdrant_client.models import (
+    HnswConfigDiff,
+    Modifier,
+    OptimizersConfigDiff,
+    PayloadSchemaType,
+    PointStruct,
+    ProductQuantization,
+    ProductQuantizationConfig,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SparseVectorParams,
+)
 from settings import settings
+from vector_database import aliases
+
+logger = logging.getLogger(__name__)
+
+COPY_BATCH_SIZE = 256
 
 
 def get_client():
@@ -15,14 +34,60 @@ def get_client():
     return client
 
 
-def create_collection(client, collection_name: str) -> None:
+def quantization_config() -> ScalarQuantization | ProductQuantization | None:
+    quantization = settings.vector_store.quantization
+    if quantization.type == "scalar":
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(
+                type=ScalarType.INT8,
+                quantile=quantization.quantile,
+                always_ram=quantization.always_ram,
+            )
+        )
+    if quantization.type == "product":
+        return ProductQuantization(
+            product=ProductQuantizationConfig(
+                compression=quantization.compression,
+                always_ram=quantization.always_ram,
+            )
+        )
+    return None
+
+
+def create_collection(client, collection_name: str, sparse: bool = False) -> None:
+    """Create a collection with the index settings of the vector store.
+
+    With `sparse`, the collection has a named sparse vector for the hybrid search.
+    The settings only apply to new collections. To change them for the live
+    collection, a new collection is populated and promoted, see
+    `vector_database.aliases`.
+    """
     if client.collection_exists(collection_name):
         return None
+    vector_store = settings.vector_store
     client.create_collection(
         collection_name=collection_name,
         vectors_config=VectorParams(
-            size=settings.vector_store.embedding_dim,
-            distance=Distance(settings.vector_store.similarity),
+            size=vector_store.embedding_dim,
+            distance=Distance(vector_store.similarity),
+            on_disk=vector_store.on_disk,
+        ),
+        on_disk_payload=vector_store.on_disk_payload,
+        hnsw_config=HnswConfigDiff(
+            m=vector_store.hnsw.m,
+            ef_construct=vector_store.hnsw.ef_construct,
+            on_disk=vector_store.hnsw.on_disk,
+        ),
+        optimizers_config=OptimizersConfigDiff(
+            indexing_threshold=vector_store.optimizers.indexing_threshold,
+            memmap_threshold=vector_store.optimizers.memmap_threshold,
+            default_segment_number=vector_store.optimizers.default_segment_number,
+        ),
+        quantization_config=quantization_config(),
+        sparse_vectors_config=(
+            {vector_store.sparse.vector_name: SparseVectorParams(modifier=Modifier.IDF)}
+            if sparse
+            else None
         ),
     )
 
@@ -37,13 +102,156 @@ def create_payload_index(
     )
 
 
-def create_collections():
-    client = get_client()
-    inc_collection_name = "inc"
-    create_collection(client=client, collection_name=inc_collection_name)
+def create_inc_collection(client, collection_name: str) -> None:
+    create_collection(
+        client=client,
+        collection_name=collection_name,
+        sparse=settings.vector_store.sparse.enabled,
+    )
+    create_inc_payload_indexes(client=client, collection_name=collection_name)
+
+
+def create_inc_payload_indexes(client, collection_name: str) -> None:
+    for field_name in [
+        "metadata.retriever_id",
+        "metadata.session",
+        "metadata.author_ids",
+        "metadata.topic_ids",
+        "metadata.document_type",
+    ]:
+        create_payload_index(
+            client=client,
+            collection_name=collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
     create_payload_index(
         client=client,
-        collection_name=inc_collection_name,
-        field_name="metadata.retriever_id",
-        field_schema=PayloadSchemaType.KEYWORD,
+        collection_name=collection_name,
+        field_name="metadata.staged",
+        field_schema=PayloadSchemaType.BOOL,
     )
+
+
+def copy_collection(client, source: str, target: str) -> None:
+    """Create the target with the vectors of the source and copy all its points."""
+    params = client.get_collection(source).config.params
+    client.create_collection(
+        collection_name=target,
+        vectors_config=params.vectors,
+        sparse_vectors_config=params.sparse_vectors,
+        on_disk_payload=params.on_disk_payload,
+    )
+    create_inc_payload_indexes(client=client, collection_name=target)
+    offset = None
+    copied = 0
+    while True:
+        points, offset = client.scroll(
+            collection_name=source,
+            limit=COPY_BATCH_SIZE,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            client.upsert(
+                collection_name=target,
+                points=[
+                    PointStruct(id=point.id, vector=point.vector, payload=point.payload)
+                    for point in points
+                ],
+                wait=True,
+            )
+        copied += len(points)
+        if offset is None:
+            break
+    logger.info(f"Copied {copied} points from {source} to {target}.")
+
+
+def migrate_legacy_collection(
+    collection_name: str | None = None, drop_legacy: bool = False
+) -> None:
+    """Move the legacy inc collection behind the alias, in two explicit steps.
+
+    Before the aliases were introduced, the live collection was a physical collection
+    with the name of the alias. Qdrant does not allow an alias next to a collection
+    of the same name, so the legacy collection has to be dropped before the alias
+    can be created, which `vector_database.aliases` never does on its own.
+
+    1. Without `drop_legacy`, the legacy collection is copied into a new physical
+       collection `inc-<timestamp>`. The copy is marked as building, so documents
+       processed or deleted meanwhile are written to it as well. The legacy
+       collection keeps serving.
+    2. With `drop_legacy` and the name of the copy, the point counts of both
+       collections are compared. Only if they match, the legacy collection is
+       dropped and the alias is created for the copy and verified. The copy holds
+       all the data, so if the alias can't be created, this step is run again.
+
+    Parameters
+    ----------
+    collection_name : str | None
+        The copy, required with `drop_legacy`.
+    drop_legacy : bool
+        Whether to drop the legacy collection and switch the alias to the copy.
+    """
+    client = get_client()
+    alias_name = settings.vector_store.collection
+    if aliases.resolve_alias(client) is not None:
+        logger.info(f"{alias_name} is an alias already, nothing to migrate.")
+        return None
+
+    if not drop_legacy:
+        if not client.collection_exists(alias_name):
+            logger.info(f"There is no legacy collection {alias_name}.")
+            return None
+        collection_name = aliases.new_collection_name()
+        aliases.mark_building(collection_name)
+        copy_collection(client, source=alias_name, target=collection_name)
+        logger.info(
+            f"Verify {collection_name} and switch to it with `python -m scripts "
+            f"migrate-legacy-collection --collection {collection_name} --drop-legacy`."
+        )
+        return None
+
+    if collection_name is None or not client.collection_exists(collection_name):
+        raise ValueError(f"The copy {collection_name} does not exist.")
+    if client.collection_exists(alias_name):
+        legacy_count = client.count(alias_name, exact=True).count
+        copy_count = client.count(collection_name, exact=True).count
+        if legacy_count != copy_count:
+            raise RuntimeError(
+                f"{collection_name} has {copy_count} points, the legacy collection "
+                f"{legacy_count}. Delete the copy and copy the collection again."
+            )
+        logger.warning(f"Dropping the legacy collection {alias_name}.")
+        client.delete_collection(alias_name)
+    aliases.switch_alias(client, collection_name)
+    aliases.unmark_building(collection_name)
+
+
+def create_collections():
+    client = get_client()
+    if client.collection_exists(settings.vector_store.collection):
+        if aliases.has_legacy_collection(client):
+            logger.warning(
+                f"{settings.vector_store.collection} is a legacy physical collection, "
+                "migrate it with `python -m scripts migrate-legacy-collection`."
+            )
+        # the payload indexes of the aliased (or a legacy) collection are updated
+        create_inc_collection(
+            client=client, collection_name=settings.vector_store.collection
+        )
+    else:
+        collection_name = aliases.new_collection_name()
+        create_inc_collection(client=client, collection_name=collection_name)
+        aliases.switch_alias(client, collection_name)
+
+    answer_cache_collection_name = settings.answer_cache.semantic_collection
+    create_collection(client=client, collection_name=answer_cache_collection_name)
+    for field_name in ["filter_key", "retriever_ids"]:
+        create_payload_index(
+            client=client,
+            collection_name=answer_cache_collection_name,
+            field_name=field_name,
+            field_schema=PayloadSchemaType.KEYWORD,
+        )
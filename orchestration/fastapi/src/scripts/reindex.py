@@ -0,0 +1,255 @@
+"""This script rebuilds the inc collection from all verified submissions in PocketBase.
+
+The submissions are parsed in a process pool, embedded in large batches and uploaded
+to a fresh collection `inc-<timestamp>`, while the live collection keeps serving
+queries. Only once every submission is indexed, the `inc` alias is switched over to
+the new collection in a single atomic operation, see `vector_database.aliases`.
+Progress is stored in a state file after every uploaded batch, so an interrupted run
+continues where it stopped.
+
+Run with `python -m scripts reindex`.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Iterator
+
+import httpx
+from langchain_core.documents import Document
+
+from scripts.create_collections import create_inc_collection, get_client
+from settings import settings
+from vector_database import aliases
+from vector_database.collections import inc
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 200
+
+
+def file_url(record: dict[str, Any]) -> str:
+    return (
+        f"{settings.pocketbase_api.host}/api/files/submissions/"
+        f"{record['id']}/{record['file']}"
+    )
+
+
+def verified_submissions() -> Iterator[dict[str, Any]]:
+    """Stream the verified submissions with a file, one page at a time."""
+    with httpx.Client(
+        headers={"X-API-TOKEN": settings.pocketbase_api.token}, timeout=30
+    ) as http_client:
+        page = 1
+        while True:
+            response = http_client.get(
+                f"{settings.pocketbase_api.host}/api/collections/submissions/records",
+                params={
+                    "page": page,
+                    "perPage": PAGE_SIZE,
+                    "filter": "verified=true",
+                    "sort": "id",
+                    "fields": "id,retriever_id,file,session,author,topic,"
+                    "document_type",
+                    "skipTotal": "true",
+                },
+            )
+            response.raise_for_status()
+            records = response.json()["items"]
+            for record in records:
+                if record.get("file"):
+                    yield record
+            if len(records) < PAGE_SIZE:
+                return
+            page += 1
+
+
+def init_parsing_process() -> None:
+    """Prepare a worker process of the pool, which only parses and chunks."""
+    # the submissions are parsed in parallel already, not their pages
+    settings.pdf_parsing.max_workers = 1
+
+
+def parse_submission(record: dict[str, Any]) -> list[Document]:
+    """Parse and chunk one submission, runs in a worker process."""
+    url = file_url(record)
+    return inc.process_document(
+        file_path=url,
+        doc_id=record["retriever_id"],
+        href=url,
+        session=record.get("session"),
+        author_ids=record.get("author"),
+        topic_ids=record.get("topic"),
+        document_type=record.get("document_type"),
+    )
+
+
+def load_state(state_file: Path) -> dict[str, Any]:
+    if state_file.exists():
+        with open(state_file, encoding="utf-8") as file:
+            return json.load(file)
+    return {}
+
+
+def save_state(state_file: Path, state: dict[str, Any]) -> None:
+    # written to a temporary file first, so an interruption never corrupts the state
+    temporary_file = state_file.with_suffix(".tmp")
+    with open(temporary_file, encoding="utf-8", mode="w") as file:
+        json.dump(state, file)
+    temporary_file.replace(state_file)
+
+
+def upload(collection_name: str, doc_chunks: list[Document]) -> None:
+    version = uuid.uuid4().hex
+    chunks_by_id = {
+        inc.point_id(doc.metadata["retriever_id"], doc): Document(
+            page_content=doc.page_content,
+            metadata={**doc.metadata, "version": version, "staged": False},
+        )
+        for doc in doc_chunks
+    }
+    if chunks_by_id:
+        inc.embed_and_upload(
+            list(chunks_by_id.values()),
+            ids=list(chunks_by_id),
+            collection_name=collection_name,
+        )
+
+
+def populate(
+    collection_name: str,
+    state_file: Path,
+    workers: int | None = None,
+    batch_size: int = 1024,
+) -> None:
+    """Index all verified submissions into an existing collection.
+
+    Parameters
+    ----------
+    collection_name : str
+        The physical collection to populate.
+    state_file : Path
+        Stores the indexed submissions, to resume an interrupted run.
+    workers : int | None
+        Number of parsing processes, defaults to the number of cores.
+    batch_size : int
+        Number of chunks collected before they are embedded and uploaded.
+    """
+    state = load_state(state_file)
+    if state.get("collection") != collection_name:
+        state = {"collection": collection_name, "done": {}}
+        save_state(state_file, state)
+    elif state["done"]:
+        logger.info(
+            f"Resuming the reindexing into {collection_name} with "
+            f"{len(state['done'])} submissions already indexed."
+        )
+    done: dict[str, str] = state["done"]
+
+    records = (record for record in verified_submissions() if record["id"] not in done)
+    failed: list[str] = []
+    pending_submissions: dict[str, str] = {}
+    pending_chunks: list[Document] = []
+    indexed = 0
+    start = time.perf_counter()
+
+    def flush() -> None:
+        nonlocal indexed
+        if not pending_submissions:
+            return
+        upload(collection_name, pending_chunks)
+        done.update(pending_submissions)
+        save_state(state_file, state)
+        indexed += len(pending_submissions)
+        seconds = time.perf_counter() - start
+        logger.info(
+            f"{indexed} submissions indexed in {seconds:.0f}s "
+            f"({indexed / seconds:.2f} docs/s)."
+        )
+        pending_submissions.clear()
+        pending_chunks.clear()
+
+    workers = workers or os.cpu_count() or 1
+    # spawned, forking a multi-threaded celery worker may deadlock. The workers only
+    # import the parsing, the embedding model is loaded on first use.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_parsing_process,
+    ) as executor:
+        max_in_flight = 2 * workers
+        in_flight: dict[Future, dict[str, Any]] = {}
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                record = next(records, None)
+                if record is None:
+                    exhausted = True
+                else:
+                    in_flight[executor.submit(parse_submission, record)] = record
+            if not in_flight:
+                break
+            completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in completed:
+                record = in_flight.pop(future)
+                try:
+                    pending_chunks.extend(future.result())
+                    pending_submissions[record["id"]] = record["retriever_id"]
+                except Exception as e:
+                    logger.error(f"Error parsing submission {record['id']}: {e}")
+                    failed.append(record["id"])
+            if len(pending_chunks) >= batch_size:
+                flush()
+        flush()
+
+    if failed:
+        logger.error(
+            f"{len(failed)} submissions could not be indexed: {failed}. Run the "
+            "reindexing again to retry them."
+        )
+        raise RuntimeError("Reindexing incomplete.")
+
+    state_file.unlink()
+    logger.info(
+        f"Indexed {len(done)} submissions into {collection_name} in "
+        f"{time.perf_counter() - start:.0f}s."
+    )
+
+
+def reindex(
+    state_file: Path = Path("reindex-state.json"),
+    workers: int | None = None,
+    batch_size: int = 1024,
+) -> None:
+    """Rebuild the inc collection and switch the alias to it.
+
+    Parameters
+    ----------
+    state_file : Path
+        Stores the new collection and the indexed submissions, to resume a run.
+    workers : int | None
+        Number of parsing processes, defaults to the number of cores.
+    batch_size : int
+        Number of chunks collected before they are embedded and uploaded.
+    """
+    client = get_client()
+    collection_name = load_state(state_file).get("collection")
+    if collection_name is None or not client.collection_exists(collection_name):
+        collection_name = aliases.new_collection_name()
+        create_inc_collection(client=client, collection_name=collection_name)
+        save_state(state_file, {"collection": collection_name, "done": {}})
+        logger.info(f"Reindexing into the new collection {collection_name}.")
+    # documents processed meanwhile are written to the new collection as well
+    aliases.mark_building(collection_name)
+    populate(
+        collection_name=collection_name,
+        state_file=state_file,
+        workers=workers,
+        batch_size=batch_size,
+    )
+    aliases.promote(client, collection_name)
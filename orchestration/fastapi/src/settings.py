@@ -1,10 +1,12 @@
 import re
+import tempfile
 from ipaddress import IPv4Network, IPv6Network
+from pathlib import Path
 from typing import Literal
 
 from pydantic import BaseModel, Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from qdrant_client.http.models import Distance
+from qdrant_client.http.models import CompressionRatio, Distance
 
 ENVIRONMENT_LITERAL = Literal["LOCAL", "DEVELOPMENT", "PRODUCTION"]
 
@@ -41,12 +43,95 @@ class CSRFSettings(BaseModel):
     http_only: bool = False
 
 
+class Hnsw(BaseModel):
+    # None keeps the default of the Qdrant server
+    m: int | None = None
+    ef_construct: int | None = None
+    on_disk: bool | None = None
+    # search-time size of the candidate list, larger values trade latency for recall
+    ef: int | None = None
+
+
+class Quantization(BaseModel):
+    type: Literal["none", "scalar", "product"] = "scalar"
+    always_ram: bool = True
+    # int8 scalar quantization ignores the outliers beyond this quantile
+    quantile: float = Field(0.99, gt=0.5, le=1)
+    compression: CompressionRatio = CompressionRatio.X16
+    rescore: bool = True
+    # the original vectors rescore `oversampling * k` quantized candidates
+    oversampling: float = Field(2.0, ge=1)
+
+
+class Optimizers(BaseModel):
+    indexing_threshold: int | None = None
+    memmap_threshold: int | None = None
+    default_segment_number: int | None = None
+
+
+class Sparse(BaseModel):
+    # new collections store a sparse vector of every chunk
+    enabled: bool = True
+    vector_name: str = "sparse"
+    # fuse the dense and the sparse search, needs a collection with sparse vectors
+    hybrid_search: bool = False
+    # candidates of the dense and of the sparse search passed to the fusion
+    prefetch_limit: int = 30
+    k1: float = 1.2
+    b: float = 0.75
+    avg_doc_length: float = 600
+
+
+class EmbeddingBackend(BaseModel):
+    # "onnx" runs the model with ONNX Runtime, needs the "onnx" dependency group
+    type: Literal["torch", "onnx"] = "torch"
+    # dynamic int8 quantization of the ONNX model for the instruction set of the CPU
+    quantization: Literal["arm64", "avx2", "avx512", "avx512_vnni"] | None = None
+    # exported once per host and shared by its processes
+    export_dir: Path = Path(tempfile.gettempdir()) / "onnx-models"
+    # drift of the backends measured by `benchmarks.embedding_backends`, the "onnx"
+    # backend is only loaded when it is within the tolerance for the model
+    drift_report: Path = (
+        Path(__file__).resolve().parent / "benchmarks" / "embedding_backends.json"
+    )
+
+
 class VectorStore(BaseModel):
     url: str
     api_key: str
+    collection: str = "inc"
     embedding_dim: int = 512
     model: str = "sentence-transformers/distiluse-base-multilingual-cased-v1"
+    backend: EmbeddingBackend = EmbeddingBackend()
     similarity: Distance = Distance.COSINE
+    query_embedding_cache_size: int = 2048
+    embedding_batch_max_size: int = 32
+    embedding_batch_max_wait_ms: float = 5.0
+    encode_batch_size: int = 64
+    upload_batch_size: int = 64
+    upload_parallel: int = 1
+    on_disk: bool = False
+    on_disk_payload: bool | None = None
+    hnsw: Hnsw = Hnsw()
+    quantization: Quantization = Quantization()
+    optimizers: Optimizers = Optimizers()
+    sparse: Sparse = Sparse()
+
+
+class PdfParsing(BaseModel):
+    # files with fewer pages are extracted in the calling process
+    parallel_min_pages: int = 40
+    max_workers: int = 4
+    pages_per_task: int = 8
+    download_timeout: float = 60.0  # seconds
+
+
+class ParseCache(BaseModel):
+    enabled: bool = True
+    # shared by the worker processes of a host
+    directory: Path = Path(tempfile.gettempdir()) / "parse-cache"
+    # the least recently used files are evicted beyond this size
+    max_size_mb: int = 512
 
 
 class LLMProvider(BaseModel):
@@ -64,9 +149,67 @@ class Redis(BaseModel):
         return f"redis://{self.host}:{self.port}/0"
 
 
+class AnswerCache(BaseModel):
+    enabled: bool = True
+    ttl: int = 60 * 60 * 24  # seconds
+    semantic_enabled: bool = True
+    semantic_collection: str = "answer_cache"
+    semantic_threshold: float = Field(default=0.92, ge=0.0, le=1.0)
+    semantic_audit_size: int = 500
+
+
+class RetrievalCache(BaseModel):
+    enabled: bool = True
+    # short, the augmentation tasks of a submission run within minutes
+    ttl: int = 60 * 15  # seconds
+
+
+class RequestCoalescing(BaseModel):
+    enabled: bool = True
+    lock_ttl: int = 15  # seconds, refreshed while the request is in flight
+    wait_timeout: float = 90.0  # seconds
+    result_ttl: int = 10  # seconds
+
+
+class Rerank(BaseModel):
+    enabled: bool = False
+    model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    # chunks fetched from the vector store and reranked to the top k
+    candidates: int = 20
+    time_budget_ms: float = 300
+
+
+class PromptContext(BaseModel):
+    # token budgets of the retrieved chunks in the prompts
+    max_tokens: int = 3000
+    augmentation_max_tokens: int = 2500
+
+
+class Augmentation(BaseModel):
+    # extract the sentences of all key elements of an article with one LLM call
+    batched: bool = True
+    # token budget of the chunks of all key elements in the batched prompt, the
+    # less relevant chunks beyond it are left out
+    batched_max_tokens: int = 8000
+
+
+class LLMLimits(BaseModel):
+    enabled: bool = True
+    # requests in flight to the provider, shared by the API and all celery workers
+    max_concurrency: int = 16
+    tokens_per_minute: int = 30000
+    # expected tokens of a completion, corrected by the usage reported afterwards
+    completion_tokens: int = 500
+    lease_ttl: int = 30  # seconds, refreshed while the request is in flight
+    acquire_timeout: float = 300.0  # seconds
+
+
 class PocketBaseAPI(BaseModel):
     host: str = Field(default="http://localhost:8090")
     token: str = Field(default="...")
+    timeout: float = 30.0  # seconds
+    # pooled connections of a worker process
+    max_connections: int = 10
 
 
 class FastAPI(BaseModel):
@@ -80,8 +223,17 @@ class Settings(BaseSettings):
     cors: CorsSettings
     csrf: CSRFSettings
     vector_store: VectorStore
+    pdf_parsing: PdfParsing = PdfParsing()
+    parse_cache: ParseCache = ParseCache()
     llm_provider: LLMProvider
     redis: Redis
+    answer_cache: AnswerCache = AnswerCache()
+    retrieval_cache: RetrievalCache = RetrievalCache()
+    request_coalescing: RequestCoalescing = RequestCoalescing()
+    rerank: Rerank = Rerank()
+    prompt_context: PromptContext = PromptContext()
+    augmentation: Augmentation = Augmentation()
+    llm_limits: LLMLimits = LLMLimits()
     pocketbase_api: PocketBaseAPI
     fastapi_api: FastAPI
 
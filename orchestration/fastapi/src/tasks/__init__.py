@@ -1,5 +1,6 @@
 from tasks.augment import augment
 from tasks.embed import embed
+from tasks.reindex import reindex
 from tasks.synchronize import synchronize
 
-__all__ = ["synchronize", "augment", "embed"]
+__all__ = ["synchronize", "augment", "embed", "reindex"]
@@ -1,13 +1,18 @@
+import asyncio
 import logging
-import os
 from typing import Any
 
 import httpx
-from qdrant_client.http.models import FieldCondition, Filter, MatchValue
+from langchain_core.language_models import BaseChatModel
 
 from settings import settings
-from tools import llm_provider
-from tools.analyse_submissions import extract_relevant_sentences
+from tasks.event_loop import run
+from tasks.resources import resources
+from tools.analyse_submissions import (
+    aextract_relevant_sentences,
+    aextract_relevant_sentences_batched,
+)
+from tools.llm_limiter import LLMLimitTimeoutError
 from worker import worker
 
 logger = logging.getLogger(__name__)
@@ -15,47 +20,117 @@ logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
+# seconds until a task which the LLM limits timed out is retried, the token budget is
+# refilled every minute
+LIMITS_RETRY_COUNTDOWN = 60
 
-@worker.task(name="augmentation")
-def augment(
+
+async def aextract_key_elements(
     submission_id: str,
-    retriever_id: str,
-    key_elements: list[str],
     article: str,
-) -> None:
-    os.environ["OPENAI_API_KEY"] = settings.llm_provider.api_key
-    llm = llm_provider.get_llm()
+    key_elements: list[str],
+    llm: BaseChatModel,
+    retriever_id: str,
+) -> dict[str, Any]:
+    """Extract the sentences of the key elements, concurrently if done one by one.
 
+    Returns
+    -------
+    dict[str, Any]
+        The payload of the submission, which is not verified if an extraction fails.
+
+    Raises
+    ------
+    LLMLimitTimeoutError
+        If the LLM limits do not allow the requests in time, the extraction did not
+        fail and is retried later.
+    """
     payload: dict[str, Any] = {"key_element": {key: "" for key in key_elements}}
-    filter = Filter(
-        must=[
-            FieldCondition(
-                key="metadata.retriever_id", match=MatchValue(value=retriever_id)
+
+    batched_result = None
+    if settings.augmentation.batched:
+        try:
+            batched_result = await aextract_relevant_sentences_batched(
+                article=article,
+                key_elements=key_elements,
+                llm=llm,
+                retriever_id=retriever_id,
             )
-        ]
-    )
-    # logger.info(key_elements, article)
+        except LLMLimitTimeoutError:
+            raise
+        except Exception as e:
+            logger.warning(
+                f"Batched extraction failed for submission {submission_id}, "
+                f"extracting the key elements one by one: {e}"
+            )
+
+    if batched_result is not None:
+        for key_element, result in batched_result.items():
+            if result:
+                payload["key_element"][key_element] = result
+        return payload
 
-    for search_key_element in key_elements:
+    async def extract(search_key_element: str) -> None:
         try:
-            result = extract_relevant_sentences(
+            result = await aextract_relevant_sentences(
                 search_key_element=search_key_element,
                 article=article,
                 key_elements=key_elements,
                 llm=llm,
-                filter=filter,
+                retriever_id=retriever_id,
             )
-            if result:
-                payload["key_element"][search_key_element] = result
+        except LLMLimitTimeoutError:
+            raise
         except Exception as e:
             logger.error(f"Error processing key element {search_key_element}: {e}")
-            del payload["key_element"]
-            payload["verified"] = False
-            break
+            raise
+        if result:
+            payload["key_element"][search_key_element] = result
+
+    # the requests are bounded by the LLM limits shared by all workers, the remaining
+    # extractions are cancelled if one fails
+    try:
+        async with asyncio.TaskGroup() as task_group:
+            for search_key_element in key_elements:
+                task_group.create_task(extract(search_key_element))
+    except ExceptionGroup as group:
+        timeouts, failures = group.split(LLMLimitTimeoutError)
+        if failures is None:
+            raise timeouts.exceptions[0]  # type: ignore[union-attr]
+        del payload["key_element"]
+        payload["verified"] = False
+    return payload
+
+
+@worker.task(name="augmentation", bind=True)
+def augment(
+    self,
+    submission_id: str,
+    retriever_id: str,
+    key_elements: list[str],
+    article: str,
+) -> None:
+    # logger.info(key_elements, article)
+
+    try:
+        payload = run(
+            aextract_key_elements(
+                submission_id=submission_id,
+                article=article,
+                key_elements=key_elements,
+                llm=resources.llm,
+                retriever_id=retriever_id,
+            )
+        )
+    except LLMLimitTimeoutError as e:
+        logger.warning(
+            f"LLM limits timed out for submission {submission_id}, retrying: {e}"
+        )
+        raise self.retry(exc=e, countdown=LIMITS_RETRY_COUNTDOWN)
 
     try:
-        response = httpx.patch(
-            f"{settings.pocketbase_api.host}/api/collections/submissions/records/{submission_id}",  # noqa: E501
+        response = resources.pocketbase_client.patch(
+            f"/api/collections/submissions/records/{submission_id}",
             json=payload,
             headers={"X-API-TOKEN": settings.pocketbase_api.token},
         )
@@ -4,6 +4,8 @@ import httpx
 
 from settings import settings
 from tasks import augment
+from tasks.resources import resources
+from vector_database import aliases
 from vector_database.collections import inc
 from worker import worker
 
@@ -21,19 +23,34 @@ def embed(
     href: str,
     session: str,
     key_elements: dict[str, list[str]] | None = None,
+    author_ids: list[str] | None = None,
+    topic_ids: list[str] | None = None,
+    document_type: str | None = None,
 ) -> None:
     try:
         doc_chunks = inc.process_document(
-            file_path=file_path, doc_id=retriever_id, href=href
+            file_path=file_path,
+            doc_id=retriever_id,
+            href=href,
+            session=session,
+            author_ids=author_ids,
+            topic_ids=topic_ids,
+            document_type=document_type,
         )
-        inc.upsert_doc_chunks(doc_id=retriever_id, doc_chunks=doc_chunks)
+        # collections which are populated to replace the live one are kept in sync
+        for collection_name in aliases.write_collections():
+            inc.upsert_doc_chunks(
+                doc_id=retriever_id,
+                doc_chunks=doc_chunks,
+                collection_name=collection_name,
+            )
         logger.info(f"Document {file_path} processed and upsert successfully.")
     except Exception as e:
         logger.error(f"Error processing document {file_path}: {e}")
         payload = {"verified": False}
         try:
-            response = httpx.patch(
-                f"{settings.pocketbase_api.host}/api/collections/submissions/records/{submission_id}",  # noqa: E501
+            response = resources.pocketbase_client.patch(
+                f"/api/collections/submissions/records/{submission_id}",
                 json=payload,
                 headers={"X-API-TOKEN": settings.pocketbase_api.token},
             )
@@ -0,0 +1,30 @@
+"""The event loop of the asynchronous parts of the celery tasks.
+
+The threads of the worker pool share one event loop, which runs in a background
+thread of the worker process. Asynchronous clients, like the HTTP client of the chat
+model or the Redis client of the LLM limits, are bound to the loop they were first
+used in, so a new loop per task with `asyncio.run` would break their connections.
+"""
+
+import asyncio
+import threading
+from typing import Any, Coroutine
+
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="task-event-loop", daemon=True
+            ).start()
+    return _loop
+
+
+def run(coroutine: Coroutine[Any, Any, Any]) -> Any:
+    """Run the coroutine in the shared event loop and wait for its result."""
+    return asyncio.run_coroutine_threadsafe(coroutine, get_event_loop()).result()
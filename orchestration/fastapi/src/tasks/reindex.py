@@ -0,0 +1,21 @@
+import logging
+import tempfile
+from pathlib import Path
+
+from scripts.reindex import populate
+from worker import worker
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+@worker.task(name="reindex")
+def reindex(collection_name: str) -> None:
+    # a retry of the task resumes from the state file
+    populate(
+        collection_name=collection_name,
+        state_file=Path(tempfile.gettempdir()) / f"reindex-{collection_name}.json",
+    )
+    logger.info(f"Collection {collection_name} is populated and can be promoted.")
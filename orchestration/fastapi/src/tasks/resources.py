@@ -0,0 +1,100 @@
+"""Clients shared by the tasks of a celery worker process.
+
+The clients are created and the embedding model is loaded once per worker process
+when it starts, on `worker_process_init` for the prefork pool and on `worker_init` for
+the threads pool, whose tasks run in the main process. The tasks borrow them instead
+of creating their own, so the connection pools are reused across tasks. Outside of a
+worker, e.g. when a task is called directly, the clients are created on first use.
+"""
+
+import logging
+import threading
+
+import httpx
+from celery.signals import worker_init, worker_process_init, worker_process_shutdown
+from langchain_core.language_models import BaseChatModel
+from qdrant_client import QdrantClient
+
+from settings import settings
+from tools import llm_provider
+from vector_database import session
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+class WorkerResources:
+    """Registry of the clients of a worker process, safe to use from all threads."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._llm: BaseChatModel | None = None
+        self._pocketbase_client: httpx.Client | None = None
+
+    def _create_pocketbase_client(self) -> httpx.Client:
+        return httpx.Client(
+            base_url=settings.pocketbase_api.host,
+            timeout=settings.pocketbase_api.timeout,
+            limits=httpx.Limits(
+                max_connections=settings.pocketbase_api.max_connections
+            ),
+        )
+
+    def init(self) -> None:
+        """Create the clients, replacing the ones inherited from a parent process, and
+        load the embedding model."""
+        with self._lock:
+            self._llm = llm_provider.get_llm()
+            # the connections of a forked client belong to the parent process
+            self._pocketbase_client = self._create_pocketbase_client()
+        try:
+            session.warm_up()
+        except Exception as e:
+            # the tasks load them on first use instead
+            logger.error(f"Warming up the vector database failed: {e}")
+        logger.info("Worker resources initialized.")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._pocketbase_client is not None:
+                self._pocketbase_client.close()
+                self._pocketbase_client = None
+
+    @property
+    def llm(self) -> BaseChatModel:
+        with self._lock:
+            if self._llm is None:
+                self._llm = llm_provider.get_llm()
+            return self._llm
+
+    @property
+    def pocketbase_client(self) -> httpx.Client:
+        with self._lock:
+            if self._pocketbase_client is None:
+                self._pocketbase_client = self._create_pocketbase_client()
+            return self._pocketbase_client
+
+    @property
+    def qdrant_client(self) -> QdrantClient:
+        # the client of the process, which the helpers of `vector_database` use too
+        return session.get_client()
+
+
+resources = WorkerResources()
+
+
+@worker_init.connect
+def init_worker(**kwargs) -> None:
+    resources.init()
+
+
+@worker_process_init.connect
+def init_worker_process(**kwargs) -> None:
+    resources.init()
+
+
+@worker_process_shutdown.connect
+def shutdown_worker_process(**kwargs) -> None:
+    resources.close()
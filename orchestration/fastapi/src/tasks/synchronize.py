@@ -1,10 +1,9 @@
 import logging
-from urllib.parse import urljoin
 
 import httpx
 
 from scraper.session_5_scraping import download_file, get_current_submissions
-from settings import settings
+from tasks.resources import resources
 from worker import worker
 
 logger = logging.getLogger(__name__)
@@ -32,11 +31,8 @@ def synchronize(base_url: str) -> None:
         }
         id: str | None = None
         try:
-            response = httpx.post(
-                url=urljoin(
-                    str(settings.pocketbase_api.host),
-                    "/api/collections/submissions/records",
-                ),
+            response = resources.pocketbase_client.post(
+                url="/api/collections/submissions/records",
                 json=payload,
             )
             response.raise_for_status()
@@ -59,11 +55,8 @@ def synchronize(base_url: str) -> None:
                     "application/pdf",
                 )
             }
-            response = httpx.patch(
-                url=urljoin(
-                    str(settings.pocketbase_api.host),
-                    f"/api/collections/submissions/records/{id}",
-                ),
+            response = resources.pocketbase_client.patch(
+                url=f"/api/collections/submissions/records/{id}",
                 files=files,
             )
             response.raise_for_status()
@@ -0,0 +1,30 @@
+from cache.answers import build_cache_key, normalize_question
+
+
+def test_normalize_question():
+    assert normalize_question("  What does  Rwanda say?\n") == "what does rwanda say"
+    assert normalize_question("What does Rwanda say") == "what does rwanda say"
+
+
+def test_cache_key_ignores_retriever_id_order():
+    first = build_cache_key("Question?", ["2", "1"], {"1": {"authors": ["A"]}})
+    second = build_cache_key("question", ["1", "2"], {"1": {"authors": ["A"]}})
+    assert first == second
+
+
+def test_cache_key_depends_on_filter_and_metadata():
+    key = build_cache_key("question", ["1"], None)
+    assert key != build_cache_key("question", ["1", "2"], None)
+    assert key != build_cache_key("question", None, None)
+    assert key != build_cache_key("question", ["1"], {"1": {"authors": ["A"]}})
+
+
+def test_cache_key_depends_on_payload_filters():
+    key = build_cache_key("question", None, None)
+    assert key == build_cache_key("question", None, None, {"sessions": []})
+    assert key != build_cache_key("question", None, None, {"sessions": ["5"]})
+    assert build_cache_key(
+        "question", None, None, {"author_ids": ["b", "a"], "sessions": ["5"]}
+    ) == build_cache_key(
+        "question", None, None, {"sessions": ["5"], "author_ids": ["a", "b"]}
+    )
@@ -0,0 +1,51 @@
+import asyncio
+import importlib
+
+import pytest
+
+from settings import settings
+from tools.llm_limiter import LLMLimitTimeoutError
+
+# the package exports the task under the name of the module
+augment = importlib.import_module("tasks.augment")
+
+KEY_ELEMENTS = ["financing", "waste pickers"]
+
+
+@pytest.fixture(autouse=True)
+def one_by_one(monkeypatch):
+    monkeypatch.setattr(settings.augmentation, "batched", False)
+
+
+def extract_key_elements() -> dict:
+    return asyncio.run(
+        augment.aextract_key_elements(
+            submission_id="submission",
+            article="Article 1",
+            key_elements=KEY_ELEMENTS,
+            llm=None,  # type: ignore[arg-type]
+            retriever_id="retriever",
+        )
+    )
+
+
+def test_limits_timeout_is_raised_for_a_retry(monkeypatch):
+    async def extract(search_key_element, **kwargs):
+        raise LLMLimitTimeoutError("No slot for a request to the LLM provider.")
+
+    monkeypatch.setattr(augment, "aextract_relevant_sentences", extract)
+
+    with pytest.raises(LLMLimitTimeoutError):
+        extract_key_elements()
+
+
+def test_failed_extraction_is_not_verified(monkeypatch):
+    async def extract(search_key_element, **kwargs):
+        if search_key_element == "financing":
+            raise ValueError("The completion is not valid.")
+        await asyncio.sleep(0.01)
+        raise LLMLimitTimeoutError("No slot for a request to the LLM provider.")
+
+    monkeypatch.setattr(augment, "aextract_relevant_sentences", extract)
+
+    assert extract_key_elements() == {"verified": False}
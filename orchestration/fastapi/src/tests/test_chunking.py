@@ -0,0 +1,101 @@
+import re
+
+import pytest
+
+from vector_database.chunking import SEPARATORS, TreatyChunker
+
+text_splitters = pytest.importorskip("langchain_text_splitters")
+
+ARTICLE = """Article {number}
+
+{title}
+
+1. Each Party shall take the measures necessary to reduce the production of primary
+plastic polymers, in accordance with Annex {number}.
+(a) develop national plans;
+(b) report on the implementation of its plans.
+
+2. Each Party shall:
+(1) promote the reuse of plastic products;
+(2) phase out problematic and avoidable plastic products. Parties may cooperate.
+
+
+"""
+
+
+def chapters_text(articles: int, title_words: int) -> str:
+    # the passages repeat, the offsets of the chunks must still be exact
+    chapters = []
+    for chapter in range(articles // 4):
+        body = "".join(
+            ARTICLE.format(
+                number=number, title="Production " * (number % 7 * title_words)
+            )
+            for number in range(chapter * 4, chapter * 4 + 4)
+        )
+        chapters.append(f"Chapter {chapter}\n\n{body}")
+    return "\n\n".join(chapters)
+
+
+def treaty_text(articles: int) -> str:
+    return chapters_text(articles, title_words=30) + "\n" + "word " * 1000 + "x" * 4500
+
+
+def recursive_splitter(
+    chunk_size: int, chunk_overlap: int, separators: list[str] | None = None
+):
+    if separators is None:
+        # the literal sentence and word separators of the chunker
+        separators = [
+            re.escape(separator) if separator in (". ", " ") else separator
+            for separator in SEPARATORS
+        ]
+    return text_splitters.RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        add_start_index=True,
+        strip_whitespace=True,
+        separators=separators,
+        is_separator_regex=True,
+    )
+
+
+def split(splitter, text: str) -> list[tuple[int, str]]:
+    return [
+        (doc.metadata["start_index"], doc.page_content)
+        for doc in splitter.create_documents([text])
+    ]
+
+
+@pytest.mark.parametrize(("chunk_size", "chunk_overlap"), [(2000, 100), (300, 60)])
+def test_chunks_match_the_recursive_splitter(chunk_size, chunk_overlap):
+    text = treaty_text(40)
+    expected = split(recursive_splitter(chunk_size, chunk_overlap), text)
+
+    chunks = TreatyChunker(chunk_size, chunk_overlap).split_text(text)
+
+    assert chunks == expected
+    for start, chunk in chunks:
+        assert text[start : start + len(chunk)] == chunk
+        assert len(chunk) <= chunk_size
+
+
+@pytest.mark.parametrize(("chunk_size", "chunk_overlap"), [(2000, 100), (300, 60)])
+def test_chunks_match_the_original_separators_without_long_lines(
+    chunk_size, chunk_overlap
+):
+    # no line exceeds the chunk size, so the original regex ". ", which matches any
+    # character before a space, never splits a piece
+    text = chapters_text(40, title_words=2)
+    expected = split(recursive_splitter(chunk_size, chunk_overlap, SEPARATORS), text)
+
+    assert TreatyChunker(chunk_size, chunk_overlap).split_text(text) == expected
+
+
+def test_documents_are_offset():
+    docs = TreatyChunker(300, 60).create_documents(
+        treaty_text(4), {"retriever_id": "test"}, offset=1000
+    )
+
+    assert docs[0].metadata == {"retriever_id": "test", "start_index": 1000}
+    assert docs[1].metadata["start_index"] > 1000
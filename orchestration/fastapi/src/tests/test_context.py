@@ -0,0 +1,57 @@
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from tools.context import build_context, remove_overlaps, strip_enrichment
+
+
+class WordCountingChatModel(FakeListChatModel):
+    def get_num_tokens(self, text: str) -> int:
+        return len(text.split())
+
+
+def chunk(retriever_id: str, start_index: int, text: str) -> Document:
+    return Document(
+        page_content=f"start_index: {start_index} | {text}",
+        metadata={"retriever_id": retriever_id, "start_index": start_index},
+    )
+
+
+def test_strip_enrichment():
+    assert strip_enrichment("start_index: 5 | author: A | text | more") == (
+        "text | more"
+    )
+    assert strip_enrichment("text without prefix") == "text without prefix"
+
+
+def test_remove_overlaps():
+    docs = [
+        chunk("1", 10, "abcdefghij"),
+        # overlaps the head of the first chunk
+        chunk("1", 5, "vwxyzabc"),
+        # contained in the first chunk
+        chunk("1", 12, "cdef"),
+        # same offsets, but another document
+        chunk("2", 12, "cdef"),
+    ]
+    assert [doc.page_content for doc in remove_overlaps(docs)] == [
+        "abcdefghij",
+        "vwxyz",
+        "cdef",
+    ]
+
+
+def test_build_context_respects_token_budget():
+    docs = [
+        chunk("1", 0, "one two three"),
+        chunk("2", 0, "four five six seven eight"),
+        chunk("3", 0, "nine"),
+    ]
+    context = build_context(
+        docs,
+        llm=WordCountingChatModel(responses=[]),
+        format_doc=lambda doc: doc.page_content + "\n",
+        max_tokens=4,
+    )
+    assert context.text == "one two three\nnine\n"
+    assert context.tokens == 4
+    assert context.omitted == 1
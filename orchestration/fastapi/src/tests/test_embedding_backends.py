@@ -0,0 +1,58 @@
+import json
+
+import pytest
+
+from vector_database.embedding_backends import (
+    EmbeddingDriftError,
+    check_drift,
+    load_embeddings,
+)
+
+MODEL = "sentence-transformers/distiluse-base-multilingual-cased-v1"
+
+
+@pytest.fixture
+def drift_report(tmp_path):
+    path = tmp_path / "embedding_backends.json"
+    path.write_text(
+        json.dumps(
+            {
+                MODEL: {
+                    "onnx": {"min_cosine": 0.9995, "within_tolerance": True},
+                    "onnx-avx2": {"min_cosine": 0.97, "within_tolerance": False},
+                }
+            }
+        )
+    )
+    return path
+
+
+def test_onnx_backend_within_the_tolerance_passes(drift_report):
+    check_drift(MODEL, "onnx", None, drift_report)
+
+
+@pytest.mark.parametrize(
+    ("model_name", "quantization"),
+    [
+        # beyond the tolerance
+        (MODEL, "avx2"),
+        # not measured
+        (MODEL, "avx512_vnni"),
+        ("other/model", None),
+    ],
+)
+def test_onnx_backend_without_known_drift_is_refused(
+    drift_report, model_name, quantization
+):
+    with pytest.raises(EmbeddingDriftError):
+        check_drift(model_name, "onnx", quantization, drift_report)
+
+
+def test_onnx_backend_is_refused_before_loading_without_a_report(tmp_path):
+    with pytest.raises(EmbeddingDriftError):
+        load_embeddings(
+            MODEL,
+            backend="onnx",
+            export_dir=tmp_path,
+            drift_report=tmp_path / "missing.json",
+        )
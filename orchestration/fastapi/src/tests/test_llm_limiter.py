@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+
+from settings import settings
+from tools.llm_limiter import LLMLimiter
+
+
+def test_concurrent_requests_are_bounded(monkeypatch):
+    monkeypatch.setattr(settings.llm_limits, "max_concurrency", 2)
+    limiter = LLMLimiter(namespace="test-concurrency")
+    in_flight = 0
+    max_in_flight = 0
+
+    async def request() -> None:
+        nonlocal in_flight, max_in_flight
+        async with limiter.limit(estimated_tokens=1):
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.05)
+            in_flight -= 1
+
+    async def run() -> None:
+        await asyncio.gather(*[request() for _ in range(6)])
+
+    asyncio.run(run())
+    assert max_in_flight == 2
+
+
+def test_request_waits_for_the_token_budget(monkeypatch):
+    monkeypatch.setattr(settings.llm_limits, "tokens_per_minute", 100)
+    monkeypatch.setattr(settings.llm_limits, "acquire_timeout", 0.1)
+    limiter = LLMLimiter(namespace="test-budget")
+
+    async def run() -> None:
+        async with limiter.limit(estimated_tokens=60):
+            pass
+        async with limiter.limit(estimated_tokens=60):
+            pass
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(run())
@@ -0,0 +1,47 @@
+import os
+
+import pytest
+
+from cache import documents as parse_cache
+from settings import settings
+
+
+@pytest.fixture
+def cache_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings.parse_cache, "directory", tmp_path)
+    monkeypatch.setattr(settings.parse_cache, "enabled", True)
+    return tmp_path
+
+
+def test_parsed_documents_are_cached_by_content_and_parser_version(cache_directory):
+    key = parse_cache.build_cache_key(b"%PDF-1.7 content", "1")
+    document = parse_cache.ParsedDocument(
+        text="Article 1\n\fArticle 2", chunks=[(0, "Article 1"), (11, "Article 2")]
+    )
+
+    assert parse_cache.get(key) is None
+    parse_cache.put(key, document)
+
+    assert parse_cache.get(key) == document
+    assert (
+        parse_cache.get(parse_cache.build_cache_key(b"%PDF-1.7 content", "2")) is None
+    )
+    assert parse_cache.get(parse_cache.build_cache_key(b"%PDF-1.7 other", "1")) is None
+
+
+def test_least_recently_used_documents_are_evicted(cache_directory, monkeypatch):
+    # random hex digits, every entry has about 0.4 MiB when compressed
+    keys = [parse_cache.build_cache_key(bytes([i]), "1") for i in range(3)]
+    for i, key in enumerate(keys):
+        text = os.urandom(400 * 1024).hex()
+        parse_cache.put(key, parse_cache.ParsedDocument(text=text, chunks=[]))
+        os.utime(cache_directory / f"{key}{parse_cache.SUFFIX}", (i, i))
+    # the first entry is used again, so the second one is the least recently used
+    assert parse_cache.get(keys[0]) is not None
+
+    monkeypatch.setattr(settings.parse_cache, "max_size_mb", 1)
+    parse_cache.evict()
+
+    assert parse_cache.get(keys[0]) is not None
+    assert parse_cache.get(keys[1]) is None
+    assert parse_cache.get(keys[2]) is not None
@@ -0,0 +1,62 @@
+import asyncio
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from vector_database.query_embeddings import CachedQueryEmbeddings, EmbeddingBatcher
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    calls: int = 0
+    batches: int = 0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        self.calls += len(texts)
+        self.batches += 1
+        return super().embed_documents(texts)
+
+
+def test_query_embeddings_are_cached():
+    wrapped = CountingEmbeddings(size=8)
+    embeddings = CachedQueryEmbeddings(
+        wrapped, cache_size=2, max_batch_size=8, max_wait_ms=1
+    )
+
+    first = embeddings.embed_query("question")
+    assert embeddings.embed_query("question") == first
+    assert asyncio.run(embeddings.aembed_query("question")) == first
+    assert wrapped.calls == 1
+
+
+def test_least_recently_used_query_is_evicted():
+    wrapped = CountingEmbeddings(size=8)
+    embeddings = CachedQueryEmbeddings(
+        wrapped, cache_size=2, max_batch_size=8, max_wait_ms=1
+    )
+
+    embeddings.embed_query("a")
+    embeddings.embed_query("b")
+    embeddings.embed_query("a")
+    embeddings.embed_query("c")  # evicts "b"
+    assert wrapped.calls == 3
+
+    embeddings.embed_query("a")
+    assert wrapped.calls == 3
+    embeddings.embed_query("b")
+    assert wrapped.calls == 4
+
+
+def test_concurrent_queries_are_encoded_in_one_batch():
+    wrapped = CountingEmbeddings(size=8)
+    batcher = EmbeddingBatcher(wrapped, max_batch_size=16, max_wait_ms=50)
+
+    async def embed_all() -> list[list[float]]:
+        return await asyncio.gather(
+            *[batcher.aembed(text) for text in ["a", "b", "a", "c"]]
+        )
+
+    vectors = asyncio.run(embed_all())
+    assert vectors[0] == vectors[2] == wrapped.embed_query("a")
+    assert vectors[1] == wrapped.embed_query("b")
+    # three distinct texts encoded in a single batch
+    assert wrapped.calls == 3
+    assert wrapped.batches == 1
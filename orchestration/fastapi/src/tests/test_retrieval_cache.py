@@ -0,0 +1,56 @@
+import asyncio
+
+from langchain_core.documents import Document
+
+from cache import retrieval as retrieval_cache
+from settings import settings
+from tools import analyse_submissions
+
+
+def test_cached_chunks_are_invalidated_with_their_submission():
+    docs = [Document(page_content="chunk", metadata={"retriever_id": "test", "_id": 1})]
+
+    async def cache_and_lookup() -> list:
+        await retrieval_cache.aset_many("test", {"query": docs}, k=5)
+        return await retrieval_cache.aget_many("test", ["query", "other"], k=5)
+
+    cached, missing = asyncio.run(cache_and_lookup())
+    assert cached == docs
+    assert missing is None
+
+    retrieval_cache.invalidate(["test"])
+    assert asyncio.run(retrieval_cache.aget_many("test", ["query"], k=5)) == [None]
+
+
+def test_vector_order_of_a_failed_reranking_is_not_cached(monkeypatch):
+    docs = [
+        Document(page_content=f"chunk {i}", metadata={"retriever_id": "test", "_id": i})
+        for i in range(3)
+    ]
+
+    class FakeEmbeddings:
+        async def aembed_query(self, text: str) -> list[float]:
+            return [1.0]
+
+    async def search(vectors, queries, k, filter):
+        return [docs for _ in queries]
+
+    async def scores(query, docs):
+        # out of the time budget
+        return None
+
+    monkeypatch.setattr(settings.rerank, "enabled", True)
+    monkeypatch.setattr(analyse_submissions, "get_embeddings", FakeEmbeddings)
+    monkeypatch.setattr(analyse_submissions, "asearch_batch_by_vector", search)
+    monkeypatch.setattr(analyse_submissions.reranker, "ascores", scores)
+    retrieval_cache.invalidate(["test"])
+
+    async def retrieve_and_lookup() -> tuple:
+        return (
+            await analyse_submissions.aretrieve("test", ["query"]),
+            await retrieval_cache.aget_many("test", ["query"], k=5),
+        )
+
+    retrieved, cached = asyncio.run(retrieve_and_lookup())
+    assert retrieved == [docs]
+    assert cached == [None]
@@ -0,0 +1,101 @@
+import asyncio
+import uuid
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.models import Distance, VectorParams
+from redis.asyncio import StrictRedis as AsyncStrictRedis
+
+from cache import answers as answer_cache
+from cache import semantic as semantic_answer_cache
+from settings import settings
+
+# cosine similarity of 0.95 and 0.8 to the cached question
+VECTORS = {
+    "What is proposed on financing?": [1.0, 0.0, 0.0, 0.0],
+    "What is proposed for financing?": [0.95, 0.3122, 0.0, 0.0],
+    "Who proposes financing?": [0.8, 0.6, 0.0, 0.0],
+}
+ANSWER = {"answer": "A dedicated fund.", "sources": []}
+
+
+class FakeEmbeddings:
+    async def aembed_query(self, text: str) -> list[float]:
+        return VECTORS[text]
+
+
+@pytest.fixture
+def semantic_cache(monkeypatch):
+    client = QdrantClient(location=":memory:")
+    client.create_collection(
+        collection_name=settings.answer_cache.semantic_collection,
+        vectors_config=VectorParams(size=4, distance=Distance.COSINE),
+    )
+    monkeypatch.setattr(semantic_answer_cache, "get_client", lambda: client)
+    monkeypatch.setattr(
+        semantic_answer_cache, "get_embeddings", lambda: FakeEmbeddings()
+    )
+    monkeypatch.setattr(settings.answer_cache, "semantic_threshold", 0.92)
+
+
+async def cache_answer(retriever_ids, filters=None) -> None:
+    key = f"test-semantic:{uuid.uuid4().hex}"
+    await answer_cache.aset(key, ANSWER, retriever_ids)
+    await semantic_answer_cache.aset(
+        key, "What is proposed on financing?", retriever_ids, None, filters
+    )
+
+
+def test_similar_questions_hit_above_the_threshold(semantic_cache):
+    async def run() -> tuple:
+        await cache_answer(["1"])
+        return (
+            await semantic_answer_cache.aget(
+                "What is proposed for financing?", ["1"], None
+            ),
+            await semantic_answer_cache.aget("Who proposes financing?", ["1"], None),
+        )
+
+    similar, different = asyncio.run(run())
+    assert similar == ANSWER
+    assert different is None
+
+
+def test_answers_are_isolated_by_filter(semantic_cache):
+    question = "What is proposed for financing?"
+
+    async def run() -> tuple:
+        await cache_answer(["1"], {"sessions": ["5"]})
+        return (
+            await semantic_answer_cache.aget(
+                question, ["1"], None, {"sessions": ["5"]}
+            ),
+            await semantic_answer_cache.aget(
+                question, ["2"], None, {"sessions": ["5"]}
+            ),
+            await semantic_answer_cache.aget(
+                question, ["1"], None, {"sessions": ["4"]}
+            ),
+            await semantic_answer_cache.aget(question, ["1"], None),
+        )
+
+    same, *other_filters = asyncio.run(run())
+    assert same == ANSWER
+    assert other_filters == [None, None, None]
+
+
+def test_stats_and_audit_without_redis(monkeypatch):
+    # nothing listens on the port
+    down = AsyncStrictRedis(host=settings.redis.host, port=1)
+    monkeypatch.setattr(semantic_answer_cache, "get_async_redis_client", lambda: down)
+
+    async def run() -> tuple:
+        return (
+            await semantic_answer_cache.astats(),
+            await semantic_answer_cache.aaudit_entries(limit=10),
+        )
+
+    stats, entries = asyncio.run(run())
+    assert stats["lookups"] == 0
+    assert stats["hit_rate"] == 0.0
+    assert entries == []
@@ -0,0 +1,58 @@
+import asyncio
+
+from cache.singleflight import SingleFlight
+
+
+def test_identical_concurrent_calls_share_one_result():
+    flight = SingleFlight(namespace="test")
+    calls = 0
+
+    async def compute() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run() -> list[str]:
+        return await asyncio.gather(*[flight.do("key", compute) for _ in range(5)])
+
+    assert asyncio.run(run()) == ["result"] * 5
+    assert calls == 1
+
+
+def test_failure_is_shared_with_concurrent_calls():
+    flight = SingleFlight(namespace="test-failure")
+
+    async def compute() -> str:
+        await asyncio.sleep(0.05)
+        raise ValueError("failed")
+
+    async def run() -> list:
+        return await asyncio.gather(
+            *[flight.do("key", compute) for _ in range(3)], return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+def test_follower_computes_the_result_if_the_leader_is_cancelled():
+    flight = SingleFlight(namespace="test-cancelled")
+    calls = 0
+
+    async def compute() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return "result"
+
+    async def run() -> str:
+        leader = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(flight.do("key", compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(run()) == "result"
+    assert calls == 2
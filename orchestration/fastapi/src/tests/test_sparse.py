@@ -0,0 +1,25 @@
+from vector_database.sparse import BM25SparseEmbeddings, token_index, tokenize
+
+
+def test_tokenize_keeps_adjacent_terms_together():
+    assert tokenize("Article 6, EPR") == [
+        "article",
+        "6",
+        "epr",
+        "article 6",
+        "6 epr",
+    ]
+
+
+def test_query_terms_match_document_terms():
+    sparse_embeddings = BM25SparseEmbeddings(k1=1.2, b=0.75, avg_doc_length=10)
+    [document] = sparse_embeddings.embed_documents(["Article 6 and article 7"])
+    query = sparse_embeddings.embed_query("article 6")
+    assert set(query.indices) <= set(document.indices)
+    weights = dict(zip(document.indices, document.values))
+    # repeated terms weigh more, but saturate
+    assert (
+        weights[token_index("6")]
+        < weights[token_index("article")]
+        < 2 * (weights[token_index("6")])
+    )
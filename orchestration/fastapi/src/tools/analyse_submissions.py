@@ -1,21 +1,27 @@
+import asyncio
 import logging
-import os
 
+from langchain_core.documents import Document
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import PromptTemplate
+from pydantic import BaseModel, Field
 from qdrant_client.models import FieldCondition, Filter, MatchValue
 
+from cache import retrieval as retrieval_cache
 from settings import settings
-from vector_database.session import inc_vector_store
-
-os.environ["OPENAI_API_KEY"] = settings.llm_provider.api_key
-
+from tools.context import build_context, count_tokens
+from tools.llm_limiter import llm_limiter
+from vector_database.collections.inc import asearch_batch_by_vector
+from vector_database.session import get_embeddings, reranker
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
 )
 
+# chunks retrieved per key element
+TOP_K = 5
+
 
 template = """
 You are an expert on submissions to the UN negotiations on the INC Plastics Treaty. You are to provide sentences from the parts of submission for each of these Key Elements of {article} of the treaty.
@@ -28,27 +34,48 @@ Submission Parts:
 
 Only give the answer for the Key Element: {search_key_element}. Separate with semicolon if different passages. Do not include any other text or explanation. If there are no relevant sentences, return an empty string."""
 
+batched_template = """
+You are an expert on submissions to the UN negotiations on the INC Plastics Treaty. You are to provide sentences from the parts of submission for each of these Key Elements of {article} of the treaty.
+
+Key Elements:
+{key_elements}
+
+Submission Parts:
+{context}
+
+Give the answer for every Key Element. Separate with semicolon if different passages. Do not include any other text or explanation. If there are no relevant sentences for a Key Element, return an empty string for it."""
+
+
+class KeyElementSentences(BaseModel):
+    key_element: str = Field(description="The Key Element exactly as given.")
+    sentences: str = Field(
+        description="The relevant sentences separated with semicolons, or empty."
+    )
+
 
-def extract_relevant_sentences(
+class KeyElementsSentences(BaseModel):
+    key_elements: list[KeyElementSentences]
+
+
+def format_doc(doc: Document) -> str:
+    return f"Reference ID {doc.metadata['retriever_id']}: {doc.page_content} \n\n"
+
+
+async def aextract_relevant_sentences(
     search_key_element: str,
     article: str,
     key_elements: list[str],
     llm: BaseChatModel,
-    filter: Filter | None = None,
+    retriever_id: str,
 ) -> str:
-    retrieved_docs = inc_vector_store.similarity_search(
-        search_key_element,
-        k=5,
-        filter=filter,
-    )
-
-    docs_content = ""
+    retrieved_docs = (await aretrieve(retriever_id, [search_key_element]))[0]
 
-    for doc in retrieved_docs:
-        temp_doc_context = (
-            f"Reference ID {doc.metadata['retriever_id']}: {doc.page_content} \n\n"
-        )
-        docs_content += temp_doc_context
+    docs_content = build_context(
+        retrieved_docs,
+        llm=llm,
+        format_doc=format_doc,
+        max_tokens=settings.prompt_context.augmentation_max_tokens,
+    ).text
 
     prompt = PromptTemplate.from_template(template)
 
@@ -62,7 +89,172 @@ def extract_relevant_sentences(
         }
     )
 
-    response = llm.invoke(messages)
+    prompt_tokens = count_tokens(llm, messages.to_string())
+    logger.info(
+        f"Prompt of {prompt_tokens} tokens for the key element {search_key_element}."
+    )
+    async with llm_limiter.limit(
+        prompt_tokens + settings.llm_limits.completion_tokens
+    ) as reservation:
+        response = await llm.ainvoke(messages)
+        reservation.record(response)
     response_content = response.content
 
     return str(response_content)
+
+
+def submission_filter(retriever_id: str) -> Filter:
+    return Filter(
+        must=[
+            FieldCondition(
+                key="metadata.retriever_id", match=MatchValue(value=retriever_id)
+            )
+        ]
+    )
+
+
+async def aretrieve(retriever_id: str, queries: list[str]) -> list[list[Document]]:
+    """Retrieve the most relevant chunks of a submission for every query.
+
+    Parameters
+    ----------
+    retriever_id : str
+        The submission which is searched.
+    queries : list[str]
+        The key elements.
+
+    Returns
+    -------
+    list[list[Document]]
+        The chunks of every query, most relevant first. Queries searched recently
+        are served from `cache.retrieval`, the others with a single batch search.
+    """
+    results = await retrieval_cache.aget_many(retriever_id, queries, k=TOP_K)
+    missing = list(
+        dict.fromkeys(query for query, docs in zip(queries, results) if docs is None)
+    )
+    if not missing:
+        return results  # type: ignore
+
+    # concurrent augmentation tasks are encoded together by the batching dispatcher
+    embeddings = get_embeddings()
+    vectors = list(
+        await asyncio.gather(*(embeddings.aembed_query(query) for query in missing))
+    )
+    filter = submission_filter(retriever_id)
+    # the vector order of a reranking out of budget is not cached in its place
+    not_reranked: set[str] = set()
+    if settings.rerank.enabled:
+        candidates = await asearch_batch_by_vector(
+            vectors, missing, k=settings.rerank.candidates, filter=filter
+        )
+        retrieved = []
+        for query, docs in zip(missing, candidates):
+            scores = await reranker.ascores(query, docs)
+            if scores is None and len(docs) > 1:
+                not_reranked.add(query)
+            retrieved.append(reranker.order(docs, scores, k=TOP_K))
+    else:
+        retrieved = await asearch_batch_by_vector(
+            vectors, missing, k=TOP_K, filter=filter
+        )
+    retrieved_by_query = dict(zip(missing, retrieved))
+    await retrieval_cache.aset_many(
+        retriever_id,
+        {
+            query: docs
+            for query, docs in retrieved_by_query.items()
+            if query not in not_reranked
+        },
+        k=TOP_K,
+    )
+    return [
+        retrieved_by_query[query] if docs is None else docs
+        for query, docs in zip(queries, results)
+    ]
+
+
+async def aretrieve_for_key_elements(
+    key_elements: list[str], retriever_id: str
+) -> list[Document]:
+    """Union of the chunks retrieved for every key element, in order of rank."""
+    results = await aretrieve(retriever_id, key_elements)
+
+    # interleaved by rank, so that the token budget of the context keeps the best
+    # chunks of every key element if it does not fit all of them
+    docs_by_id: dict[str, Document] = {}
+    for rank in range(max((len(docs) for docs in results), default=0)):
+        for docs in results:
+            if rank < len(docs):
+                docs_by_id.setdefault(str(docs[rank].metadata["_id"]), docs[rank])
+    return list(docs_by_id.values())
+
+
+async def aextract_relevant_sentences_batched(
+    article: str,
+    key_elements: list[str],
+    llm: BaseChatModel,
+    retriever_id: str,
+) -> dict[str, str]:
+    """Extract the sentences of all key elements with a single LLM call.
+
+    The chunks of all key elements share the token budget of the batched prompt,
+    the less relevant chunks of many key elements are left out.
+
+    Parameters
+    ----------
+    article : str
+        The article of the treaty.
+    key_elements : list[str]
+        The key elements of the article.
+    llm : BaseChatModel
+        The language model, which has to support structured output.
+    retriever_id : str
+        The submission which is searched.
+
+    Returns
+    -------
+    dict[str, str]
+        The sentences by key element.
+    """
+    retrieved_docs = await aretrieve_for_key_elements(
+        key_elements, retriever_id=retriever_id
+    )
+    context = build_context(
+        retrieved_docs,
+        llm=llm,
+        format_doc=format_doc,
+        max_tokens=settings.augmentation.batched_max_tokens,
+    )
+    if context.omitted:
+        logger.info(
+            f"{context.omitted} chunks of {article} exceed the token budget of "
+            f"{len(key_elements)} key elements."
+        )
+
+    prompt = PromptTemplate.from_template(batched_template)
+    messages = prompt.invoke(
+        {
+            "article": article,
+            "key_elements": ";".join(key_elements),
+            "context": context.text,
+        }
+    )
+    prompt_tokens = count_tokens(llm, messages.to_string())
+    async with llm_limiter.limit(
+        prompt_tokens + len(key_elements) * settings.llm_limits.completion_tokens
+    ) as reservation:
+        response = await llm.with_structured_output(
+            KeyElementsSentences, include_raw=True
+        ).ainvoke(messages)
+        reservation.record(response["raw"])
+    parsed = response["parsed"]
+    if parsed is None:
+        raise ValueError(f"Invalid structured output: {response['parsing_error']}")
+    logger.info(
+        f"Extracted {len(key_elements)} key elements of {article} with one call, "
+        f"usage: {getattr(response['raw'], 'usage_metadata', None)}"
+    )
+
+    sentences = {item.key_element: item.sentences for item in parsed.key_elements}
+    return {key_element: sentences.get(key_element, "") for key_element in key_elements}
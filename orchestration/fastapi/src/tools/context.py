@@ -0,0 +1,129 @@
+"""Assembly of the retrieved chunks into the context of a prompt.
+
+The chunks are passed in order of relevance. The prefix added by
+`enrich_doc_chunks` is removed, since it only repeats the metadata, and text which
+the splitter duplicated into the overlap of neighbouring chunks is included once.
+Chunks are added until the token budget is spent.
+"""
+
+import logging
+import re
+from typing import Callable, NamedTuple
+
+from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+# see `vector_database.collections.inc.enrich_doc_chunks`
+ENRICHMENT_PREFIX = re.compile(
+    r"^start_index: [^|]*\| (?:author: [^|]*\| )?(?:article number: [^|]*\| )?"
+)
+
+
+def strip_enrichment(page_content: str) -> str:
+    return ENRICHMENT_PREFIX.sub("", page_content, count=1)
+
+
+def count_tokens(llm: BaseChatModel, text: str) -> int:
+    try:
+        return llm.get_num_tokens(text)
+    except Exception as e:
+        # a rough estimate, if the tokenizer of the provider is not available
+        logger.warning(f"Counting tokens failed, estimating them instead: {e}")
+        return len(text) // 4
+
+
+def remove_overlaps(docs: list[Document]) -> list[Document]:
+    """Strip the enrichment prefix and the text already contained in other chunks.
+
+    Parameters
+    ----------
+    docs : list[Document]
+        The chunks in order of relevance.
+
+    Returns
+    -------
+    list[Document]
+        Copies of the chunks without the duplicated text. Chunks which are entirely
+        contained in more relevant chunks of the same document are dropped.
+    """
+    spans: dict[str, list[tuple[int, int]]] = {}
+    unique_docs = []
+    for doc in docs:
+        text = strip_enrichment(doc.page_content)
+        start = doc.metadata.get("start_index")
+        retriever_id = doc.metadata.get("retriever_id", "")
+        if start is not None:
+            end = start + len(text)
+            for span_start, span_end in spans.get(retriever_id, []):
+                if span_start <= start and end <= span_end:
+                    text = ""
+                    break
+                if span_start <= start < span_end:
+                    # the head of the chunk overlaps the end of a previous chunk
+                    text = text[span_end - start :]
+                    start = span_end
+                elif start < span_start < end <= span_end:
+                    # the tail of the chunk overlaps the start of a previous chunk
+                    text = text[: span_start - start]
+                    end = span_start
+            if not text.strip():
+                continue
+            spans.setdefault(retriever_id, []).append((start, end))
+        unique_docs.append(Document(page_content=text.strip(), metadata=doc.metadata))
+    return unique_docs
+
+
+class Context(NamedTuple):
+    text: str
+    tokens: int
+    # chunks left out because they exceed the budget
+    omitted: int
+
+
+def build_context(
+    docs: list[Document],
+    llm: BaseChatModel,
+    format_doc: Callable[[Document], str],
+    max_tokens: int,
+) -> Context:
+    """Concatenate the formatted chunks within the token budget.
+
+    Parameters
+    ----------
+    docs : list[Document]
+        The chunks in order of relevance.
+    llm : BaseChatModel
+        The model whose tokenizer counts the tokens.
+    format_doc : Callable[[Document], str]
+        Formats a chunk, whose content is already stripped, for the prompt.
+    max_tokens : int
+        The token budget of the context.
+
+    Returns
+    -------
+    Context
+        The context, its number of tokens and the number of omitted chunks.
+    """
+    parts = []
+    tokens = 0
+    unique_docs = remove_overlaps(docs)
+    for doc in unique_docs:
+        part = format_doc(doc)
+        part_tokens = count_tokens(llm, part)
+        if tokens + part_tokens > max_tokens:
+            # a less relevant but shorter chunk may still fit
+            continue
+        parts.append(part)
+        tokens += part_tokens
+    logger.info(
+        f"Context of {tokens} tokens from {len(parts)} of {len(docs)} chunks "
+        f"({len(docs) - len(unique_docs)} contained in other chunks)."
+    )
+    return Context(
+        text="".join(parts), tokens=tokens, omitted=len(unique_docs) - len(parts)
+    )
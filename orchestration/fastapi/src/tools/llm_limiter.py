@@ -0,0 +1,231 @@
+"""Limits of the requests to the LLM provider shared by all processes.
+
+The API and every celery worker acquire a slot of a Redis backed semaphore before a
+request, so that the number of concurrent requests is bounded globally. In addition
+the tokens of the requests are counted in windows of one minute, a request waits for
+the next window if it would exceed the budget of `settings.llm_limits`. The tokens
+are reserved with an estimate before the request and corrected by the usage which the
+provider reports. If Redis is not available the requests are not limited.
+"""
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
+
+from redis.exceptions import RedisError
+
+from cache.session import get_async_redis_client
+from metrics import metrics
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+KEY_PREFIX = "llm-limits"
+
+# Holders of the semaphore are stored in a sorted set, scored by the expiry of their
+# lease, so that the slots of crashed processes are freed.
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[2]), ARGV[3])
+    redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])))
+    return 1
+end
+return 0
+"""
+
+REFRESH_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZADD', KEYS[1], 'XX', now + tonumber(ARGV[1]), ARGV[2])
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[1])))
+return 1
+"""
+
+# Returns the reserved window, or -1 and the seconds until the next window. A request
+# larger than the budget is allowed into an empty window, it would never fit otherwise.
+RESERVE_SCRIPT = """
+local time = redis.call('TIME')
+local window = math.floor(tonumber(time[1]) / 60)
+local key = KEYS[1] .. ':' .. window
+local used = tonumber(redis.call('GET', key) or '0')
+local tokens = tonumber(ARGV[1])
+if used > 0 and used + tokens > tonumber(ARGV[2]) then
+    return {-1, 60 - tonumber(time[1]) % 60}
+end
+redis.call('INCRBY', key, tokens)
+redis.call('EXPIRE', key, 120)
+return {window, 0}
+"""
+
+# the key of the window expires after two windows, a late correction is dropped
+CORRECT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('INCRBY', KEYS[1], ARGV[1])
+end
+return 1
+"""
+
+
+class LLMLimitTimeoutError(TimeoutError):
+    """Raised when the limits do not allow a request within the acquire timeout."""
+
+
+class Reservation:
+    """Tokens reserved for a request, the usage is set once the request is done."""
+
+    def __init__(self, window: int | None, tokens: int) -> None:
+        self.window = window
+        self.tokens = tokens
+        self.used_tokens: int | None = None
+
+    def record(self, message: Any) -> None:
+        """Record the usage reported with the response of a chat model."""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            self.used_tokens = usage["total_tokens"]
+
+
+class LLMLimiter:
+    """Distributed semaphore and token budget of the requests to the LLM provider.
+
+    Parameters
+    ----------
+    namespace : str
+        Prefix of the keys, processes using the same namespace share the limits.
+    """
+
+    def __init__(self, namespace: str = "llm") -> None:
+        self.namespace = namespace
+
+    def _key(self, suffix: str) -> str:
+        return f"{KEY_PREFIX}:{self.namespace}:{suffix}"
+
+    async def _sleep(self, seconds: float) -> None:
+        # jitter, so that waiting processes do not retry in lockstep
+        await asyncio.sleep(seconds * random.uniform(0.5, 1.5))
+
+    async def _reserve(self, tokens: int, deadline: float) -> int:
+        while True:
+            window, wait = await get_async_redis_client().eval(
+                RESERVE_SCRIPT,
+                1,
+                self._key("tokens"),
+                tokens,
+                settings.llm_limits.tokens_per_minute,
+            )
+            if window >= 0:
+                return window
+            if time.monotonic() + wait > deadline:
+                raise LLMLimitTimeoutError(
+                    "The token budget of the LLM provider is spent."
+                )
+            metrics.increment(f"llm_limits.{self.namespace}.budget_waits")
+            await self._sleep(wait)
+
+    async def _acquire(self, token: str, deadline: float) -> None:
+        interval = 0.1
+        while not await get_async_redis_client().eval(
+            ACQUIRE_SCRIPT,
+            1,
+            self._key("semaphore"),
+            settings.llm_limits.max_concurrency,
+            settings.llm_limits.lease_ttl,
+            token,
+        ):
+            if time.monotonic() + interval > deadline:
+                raise LLMLimitTimeoutError("No slot for a request to the LLM provider.")
+            metrics.increment(f"llm_limits.{self.namespace}.semaphore_waits")
+            await self._sleep(interval)
+            interval = min(2 * interval, 0.5)
+
+    async def _keep_lease(self, token: str) -> None:
+        interval = settings.llm_limits.lease_ttl / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await get_async_redis_client().eval(
+                    REFRESH_SCRIPT,
+                    1,
+                    self._key("semaphore"),
+                    settings.llm_limits.lease_ttl,
+                    token,
+                )
+            except RedisError as e:
+                logger.warning(f"Refreshing the LLM semaphore lease failed: {e}")
+
+    async def _release(self, token: str, reservation: Reservation) -> None:
+        redis_client = get_async_redis_client()
+        try:
+            await redis_client.zrem(self._key("semaphore"), token)
+            if reservation.window is not None and reservation.used_tokens is not None:
+                await redis_client.eval(
+                    CORRECT_SCRIPT,
+                    1,
+                    f"{self._key('tokens')}:{reservation.window}",
+                    reservation.used_tokens - reservation.tokens,
+                )
+        except RedisError as e:
+            logger.warning(f"Releasing the LLM limits failed: {e}")
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens: int) -> AsyncIterator[Reservation]:
+        """Wait for a slot and the token budget of a request.
+
+        Parameters
+        ----------
+        estimated_tokens : int
+            The tokens of the prompt and the expected tokens of the completion.
+
+        Yields
+        ------
+        Reservation
+            Record the reported usage on it to correct the estimate.
+
+        Raises
+        ------
+        LLMLimitTimeoutError
+            If the limits do not allow the request within
+            `settings.llm_limits.acquire_timeout`.
+        """
+        if not settings.llm_limits.enabled:
+            yield Reservation(window=None, tokens=estimated_tokens)
+            return
+
+        start = time.monotonic()
+        deadline = start + settings.llm_limits.acquire_timeout
+        token = uuid.uuid4().hex
+        reservation = Reservation(window=None, tokens=estimated_tokens)
+        try:
+            reservation.window = await self._reserve(estimated_tokens, deadline)
+            await self._acquire(token, deadline)
+        except RedisError as e:
+            logger.warning(f"The requests to the LLM provider are not limited: {e}")
+            reservation.window = None
+        except LLMLimitTimeoutError:
+            # the reserved tokens are given back
+            reservation.used_tokens = 0
+            await self._release(token, reservation)
+            raise
+        metrics.observe(
+            f"llm_limits.{self.namespace}.wait_seconds", time.monotonic() - start
+        )
+
+        heartbeat = asyncio.create_task(self._keep_lease(token))
+        try:
+            yield reservation
+        finally:
+            heartbeat.cancel()
+            await self._release(token, reservation)
+
+
+llm_limiter = LLMLimiter()
@@ -14,4 +14,6 @@ def get_llm() -> BaseChatModel:
     return init_chat_model(
         model=settings.llm_provider.model,
         model_provider=settings.llm_provider.provider,
+        # passed explicitly, so that no process has to set the environment variable
+        api_key=settings.llm_provider.api_key,
     )
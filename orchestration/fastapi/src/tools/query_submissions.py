@@ -9,10 +9,17 @@ from langgraph.graph.state import CompiledStateGraph
 from pydantic import BaseModel
 from qdrant_client.http.models import Filter
 
-from vector_database.session import inc_vector_store
+from settings import settings
+from tools.context import build_context, count_tokens
+from tools.llm_limiter import llm_limiter
+from vector_database.collections.inc import asearch_by_vector
+from vector_database.session import get_embeddings, reranker
 
 logger = logging.getLogger(__name__)
 
+# number of chunks passed into the prompt
+TOP_K = 7
+
 
 template = """
 You are an academic assistant that answers questions based on provided parts from submissions from the countries for the UN negotiations on the INC Plastics Treaty.
@@ -65,14 +72,37 @@ async def retrieve(state: State) -> dict[str, list[Document]]:
     dict[str, list[Document]]
         A dictionary containing the retrieved documents under the key 'context'.
     """
-    retrieved_docs = await inc_vector_store.asimilarity_search(
-        state.question,
-        k=7,
+    # Encode the question through the batching dispatcher of the cached embeddings
+    # instead of letting the vector store encode it on its own.
+    embedding = await get_embeddings().aembed_query(state.question)
+    retrieved_docs = await asearch_by_vector(
+        embedding,
+        query=state.question,
+        # over-fetched for the rerank node, which keeps the top k
+        k=settings.rerank.candidates if settings.rerank.enabled else TOP_K,
         filter=state.filter,
     )
     return {"context": retrieved_docs}
 
 
+async def rerank(state: State) -> dict[str, list[Document]]:
+    """
+    Rerank the retrieved documents with the cross-encoder and keep the top k.
+
+    Parameters
+    ----------
+    state : State
+        The current state containing the question and the retrieved documents.
+
+    Returns
+    -------
+    dict[str, list[Document]]
+        A dictionary containing the reranked documents under the key 'context'.
+    """
+    reranked_docs = await reranker.arerank(state.question, state.context, k=TOP_K)
+    return {"context": reranked_docs}
+
+
 def generate_factory(llm: BaseChatModel) -> Callable:
     """
     Factory function to create the generate function using the provided LLM. The generate function
@@ -90,8 +120,7 @@ def generate_factory(llm: BaseChatModel) -> Callable:
     """
 
     async def generate(state: State) -> dict[str, Any]:
-        docs_content = "Documents:\n"
-        for doc in state.context:
+        def format_doc(doc: Document) -> str:
             submission_metadata = state.submission_metadata.get(
                 doc.metadata["retriever_id"], {}
             )
@@ -112,10 +141,15 @@ def generate_factory(llm: BaseChatModel) -> Callable:
 
             page_content += doc.page_content
 
-            temp_doc_context = (
-                f"Reference ID {doc.metadata['retriever_id']}: {page_content}\n"
-            )
-            docs_content += temp_doc_context
+            return f"Reference ID {doc.metadata['retriever_id']}: {page_content}\n"
+
+        context = build_context(
+            state.context,
+            llm=llm,
+            format_doc=format_doc,
+            max_tokens=settings.prompt_context.max_tokens,
+        )
+        docs_content = "Documents:\n" + context.text
 
         prompt = PromptTemplate.from_template(template)
         messages = prompt.invoke(
@@ -124,8 +158,19 @@ def generate_factory(llm: BaseChatModel) -> Callable:
                 "context": docs_content,
             }
         )
-        response = await llm.ainvoke(messages)
-        return {"answer": response.content}
+        prompt_tokens = count_tokens(llm, messages.to_string())
+        logger.info(f"Prompt of {prompt_tokens} tokens for the query submissions tool.")
+        # Streaming the response lets the graph emit tokens in the "messages" stream
+        # mode while the complete answer is still returned for `ainvoke`.
+        answer = ""
+        async with llm_limiter.limit(
+            prompt_tokens + settings.llm_limits.completion_tokens
+        ) as reservation:
+            async for chunk in llm.astream(messages):
+                answer += str(chunk.content)
+                # the usage is reported with the last chunk
+                reservation.record(chunk)
+        return {"answer": answer}
 
     return generate
 
@@ -145,7 +190,8 @@ def build_query_submissions_tool(llm: BaseChatModel) -> CompiledStateGraph:
         The compiled state graph for querying submissions.
     """
     gen = generate_factory(llm=llm)
-    graph_builder = StateGraph(State).add_sequence([retrieve, gen])
+    nodes = [retrieve, rerank, gen] if settings.rerank.enabled else [retrieve, gen]
+    graph_builder = StateGraph(State).add_sequence(nodes)
     graph_builder.add_edge(START, "retrieve")
     graph = graph_builder.compile()
     return graph
@@ -1,10 +1,15 @@
+import hashlib
+import json
 import logging
 import os
 
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import PromptTemplate
 
+from cache.singleflight import SingleFlight
 from settings import settings
+from tools.context import count_tokens
+from tools.llm_limiter import llm_limiter
 
 os.environ["OPENAI_API_KEY"] = settings.llm_provider.api_key
 
@@ -62,7 +67,38 @@ async def summarize(
         }
     )
 
-    response = await llm.ainvoke(messages)
+    async with llm_limiter.limit(
+        count_tokens(llm, messages.to_string()) + settings.llm_limits.completion_tokens
+    ) as reservation:
+        response = await llm.ainvoke(messages)
+        reservation.record(response)
     response_content = response.content
 
     return str(response_content)
+
+
+summarize_flight = SingleFlight(namespace="summarize")
+
+
+async def summarize_coalesced(
+    submission_extracts: list[dict[str, str | list[str]]],
+    key_element: str,
+    llm: BaseChatModel,
+) -> str:
+    """Summarize like `summarize`, sharing one LLM call between identical requests
+    which are in flight at the same time."""
+    key = hashlib.sha256(
+        json.dumps(
+            {"key_element": key_element, "submission_extracts": submission_extracts},
+            sort_keys=True,
+            ensure_ascii=False,
+        ).encode("utf-8")
+    ).hexdigest()
+    return await summarize_flight.do(
+        key,
+        lambda: summarize(
+            submission_extracts=submission_extracts,
+            key_element=key_element,
+            llm=llm,
+        ),
+    )
@@ -0,0 +1,159 @@
+"""Blue/green switching of the physical collection behind the inc alias.
+
+The application only addresses the alias `settings.vector_store.collection`. A new
+physical collection is marked as building while it is populated, so that documents
+which are processed or deleted meanwhile are written to it as well. Promoting the
+collection switches the alias in a single atomic operation, which never deletes a
+collection. The physical collection which was live before the aliases were
+introduced carries the name of the alias and is migrated once, see
+`scripts.create_collections.migrate_legacy_collection`.
+"""
+
+import logging
+import time
+
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+)
+from redis.exceptions import RedisError
+
+from cache import answers as answer_cache
+from cache import retrieval as retrieval_cache
+from cache import semantic as semantic_answer_cache
+from cache.session import redis_client
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+BUILDING_KEY = "vector-store:building"
+SCROLL_LIMIT = 10_000
+
+
+class LegacyCollectionError(RuntimeError):
+    """The name of the alias is taken by the legacy physical collection."""
+
+
+def new_collection_name() -> str:
+    return f"{settings.vector_store.collection}-{time.strftime('%Y%m%d%H%M%S')}"
+
+
+def resolve_alias(client: QdrantClient) -> str | None:
+    """Name of the physical collection behind the alias, None if there is none."""
+    for alias in client.get_aliases().aliases:
+        if alias.alias_name == settings.vector_store.collection:
+            return alias.collection_name
+    return None
+
+
+def building_collections() -> list[str]:
+    try:
+        return sorted(
+            member.decode()
+            for member in redis_client.smembers(BUILDING_KEY)  # type: ignore
+        )
+    except RedisError as e:
+        logger.error(f"Reading the collections under construction failed: {e}")
+        return []
+
+
+def mark_building(collection_name: str) -> None:
+    redis_client.sadd(BUILDING_KEY, collection_name)
+
+
+def unmark_building(collection_name: str) -> None:
+    redis_client.srem(BUILDING_KEY, collection_name)
+
+
+def write_collections() -> list[str]:
+    """The alias and all collections which are populated to replace it."""
+    return [settings.vector_store.collection, *building_collections()]
+
+
+def retriever_ids(client: QdrantClient, collection_name: str) -> set[str]:
+    ids: set[str] = set()
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            limit=SCROLL_LIMIT,
+            offset=offset,
+            with_payload=["metadata.retriever_id"],
+            with_vectors=False,
+        )
+        ids.update(
+            point.payload["metadata"]["retriever_id"]
+            for point in points
+            if point.payload
+        )
+        if offset is None:
+            return ids
+
+
+def has_legacy_collection(client: QdrantClient) -> bool:
+    """Whether a physical collection has the name of the alias."""
+    return resolve_alias(client) is None and client.collection_exists(
+        settings.vector_store.collection
+    )
+
+
+def switch_alias(client: QdrantClient, collection_name: str) -> None:
+    """Point the alias to the collection.
+
+    Raises
+    ------
+    LegacyCollectionError
+        If the legacy physical collection has not been migrated yet, because an
+        alias can not share the name of a collection.
+    """
+    alias_name = settings.vector_store.collection
+    operations: list[DeleteAliasOperation | CreateAliasOperation] = []
+    if resolve_alias(client) is not None:
+        operations.append(
+            DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias_name))
+        )
+    elif client.collection_exists(alias_name):
+        raise LegacyCollectionError(
+            f"{alias_name} is a physical collection, migrate it first with "
+            "`python -m scripts migrate-legacy-collection`."
+        )
+    operations.append(
+        CreateAliasOperation(
+            create_alias=CreateAlias(
+                collection_name=collection_name, alias_name=alias_name
+            )
+        )
+    )
+    client.update_collection_aliases(change_aliases_operations=operations)
+    if resolve_alias(client) != collection_name:
+        raise RuntimeError(f"Alias {alias_name} does not point to {collection_name}.")
+    logger.info(f"Alias {alias_name} points to the collection {collection_name}.")
+
+
+def promote(client: QdrantClient, collection_name: str) -> None:
+    """Switch the alias to a populated collection and drop the outdated answers.
+
+    Parameters
+    ----------
+    client : QdrantClient
+        The Qdrant client.
+    collection_name : str
+        The physical collection which is served from now on.
+    """
+    invalidated_ids = retriever_ids(client, collection_name)
+    if client.collection_exists(settings.vector_store.collection):
+        invalidated_ids |= retriever_ids(client, settings.vector_store.collection)
+    switch_alias(client, collection_name)
+    try:
+        unmark_building(collection_name)
+    except RedisError as e:
+        logger.error(f"Unmarking the collection {collection_name} failed: {e}")
+    answer_cache.invalidate(list(invalidated_ids))
+    semantic_answer_cache.invalidate(list(invalidated_ids))
+    retrieval_cache.invalidate(list(invalidated_ids))
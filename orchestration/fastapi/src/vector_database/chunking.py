@@ -0,0 +1,220 @@
+"""Chunking of treaty texts along their structure.
+
+The chunks follow the rules of the recursive character splitter which was used
+before: a text is split at the first of the `SEPARATORS` it contains, the separator
+is kept at the start of the following piece, consecutive pieces are merged into
+chunks of up to `chunk_size` characters with an overlap of up to `chunk_overlap`, and
+pieces which are too large are split recursively at the next separators.
+
+Instead of searching every piece for the separators again on every level of the
+recursion and copying it into smaller strings, every separator is searched once in
+the whole text, when a piece is split at it for the first time. The separators of a
+piece are then looked up by their offsets. Sentences and words are only searched in
+the rare pieces without any line break that still exceed the chunk size. The chunks
+are spans of the text, so their start offsets are exact, even for repeated passages.
+"""
+
+import bisect
+import re
+
+from langchain_core.documents import Document
+
+# The boundaries in order of precedence, the sentence separator is literal, unlike
+# the regex ". " of the recursive character splitter, which matched any character
+# before a space.
+SEPARATORS = [
+    "\n\nArticle ",
+    "\n\nChapter ",
+    "\n\nSection ",
+    "\n\n\n",  # major sections
+    "\n\n",  # paragraphs
+    r"\n\n(?=\d+\.)",  # numbered paragraphs (1. 2. 3.)
+    r"\n(?=\([0-9]+\))",  # parenthetical numbers (1) (2) (3)
+    r"\n(?=\([a-z]\))",  # lettered items (a) (b) (c)
+    "\n",
+    ". ",  # sentences
+    " ",  # words
+    "",  # characters
+]
+
+# Patterns of the separators up to the single line break, which include the text of
+# the lookaheads. A separator is found in a span if the whole match is within it.
+PATTERNS = {
+    0: re.compile(r"\n\nArticle "),
+    1: re.compile(r"\n\nChapter "),
+    2: re.compile(r"\n\nSection "),
+    3: re.compile(r"\n\n\n"),
+    4: re.compile(r"\n\n"),
+    5: re.compile(r"\n\n\d+\."),
+    6: re.compile(r"\n\([0-9]+\)"),
+    7: re.compile(r"\n\([a-z]\)"),
+    8: re.compile(r"\n"),
+}
+NEWLINE_RUN = re.compile(r"\n+")
+# levels whose matches depend on where a run of line breaks is entered
+NEWLINE_COUNTS = {3: 3, 4: 2}
+LITERALS = {9: ". ", 10: " "}
+CHARACTERS = 11
+
+
+class TreatyChunker:
+    """Split treaty texts into overlapping chunks at their structural boundaries.
+
+    Parameters
+    ----------
+    chunk_size : int
+        Maximum number of characters of a chunk.
+    chunk_overlap : int
+        Maximum number of characters shared by consecutive chunks.
+    """
+
+    def __init__(self, chunk_size: int, chunk_overlap: int) -> None:
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    def split_text(self, text: str) -> list[tuple[int, str]]:
+        """Split a text into chunks.
+
+        Parameters
+        ----------
+        text : str
+            The text of a document.
+
+        Returns
+        -------
+        list[tuple[int, str]]
+            The start offset in the text and the stripped text of every chunk.
+        """
+        return _Split(text, self.chunk_size, self.chunk_overlap).chunks(0, len(text), 0)
+
+    def create_documents(
+        self, text: str, metadata: dict, offset: int = 0
+    ) -> list[Document]:
+        """Split a text into chunks with the metadata and their `start_index`.
+
+        Parameters
+        ----------
+        text : str
+            The text, which may be a part of a document.
+        metadata : dict
+            Copied into every chunk.
+        offset : int
+            The position of the text in the document, added to the `start_index`.
+
+        Returns
+        -------
+        list[Document]
+            The chunks.
+        """
+        return [
+            Document(
+                page_content=chunk,
+                metadata={**metadata, "start_index": offset + start},
+            )
+            for start, chunk in self.split_text(text)
+        ]
+
+
+class _Split:
+    """The splitting of one text, with the positions of the separators in it."""
+
+    def __init__(self, text: str, chunk_size: int, chunk_overlap: int) -> None:
+        self.text = text
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # start and end of the matches of a level in the whole text, found on first use
+        self._spans: dict[int, tuple[list[int], list[int]]] = {}
+
+    def _level_spans(self, level: int) -> tuple[list[int], list[int]]:
+        if level not in self._spans:
+            starts, ends = [], []
+            for match in PATTERNS[level].finditer(self.text):
+                starts.append(match.start())
+                ends.append(match.end())
+            self._spans[level] = (starts, ends)
+        return self._spans[level]
+
+    def _matches(self, level: int, start: int, end: int) -> list[int]:
+        """Positions of the separator of a level in the span, from left to right and
+        without overlaps, like a regex search within the span."""
+        text = self.text
+        if level in LITERALS:
+            literal = LITERALS[level]
+            positions = []
+            position = text.find(literal, start, end)
+            while position != -1:
+                positions.append(position)
+                position = text.find(literal, position + len(literal), end)
+            return positions
+
+        starts, ends = self._level_spans(level)
+        first = bisect.bisect_left(starts, start)
+        # the matches do not overlap, so their ends are ordered as well
+        last = bisect.bisect_right(ends, end)
+        if (
+            level in NEWLINE_COUNTS
+            and 0 < start < end
+            and text[start - 1] == text[start] == "\n"
+        ):
+            # the span starts within a run, whose line breaks are counted from there
+            count = NEWLINE_COUNTS[level]
+            run_end = min(NEWLINE_RUN.match(text, start).end(), end)  # type: ignore
+            first = max(first, bisect.bisect_left(starts, run_end))
+            return [*range(start, run_end - count + 1, count), *starts[first:last]]
+        return starts[first:last]
+
+    def chunks(self, start: int, end: int, level: int) -> list[tuple[int, str]]:
+        for level in range(level, len(SEPARATORS)):
+            if level == CHARACTERS:
+                positions = list(range(start + 1, end))
+                break
+            positions = self._matches(level, start, end)
+            if positions:
+                break
+        # the separators stay at the start of the following piece
+        bounds = [start, *(p for p in positions if p != start), end]
+        pieces = list(zip(bounds, bounds[1:]))
+
+        chunks: list[tuple[int, str]] = []
+        good_pieces: list[tuple[int, int]] = []
+        for piece_start, piece_end in pieces:
+            if piece_end - piece_start < self.chunk_size:
+                good_pieces.append((piece_start, piece_end))
+                continue
+            if good_pieces:
+                chunks.extend(self._merge(good_pieces))
+                good_pieces = []
+            if level == CHARACTERS:
+                chunks.extend(self._join(piece_start, piece_end))
+            else:
+                chunks.extend(self.chunks(piece_start, piece_end, level + 1))
+        if good_pieces:
+            chunks.extend(self._merge(good_pieces))
+        return chunks
+
+    def _join(self, start: int, end: int) -> list[tuple[int, str]]:
+        chunk = self.text[start:end]
+        stripped = chunk.lstrip()
+        if not stripped:
+            return []
+        return [(start + len(chunk) - len(stripped), stripped.rstrip())]
+
+    def _merge(self, pieces: list[tuple[int, int]]) -> list[tuple[int, str]]:
+        """Merge consecutive pieces into chunks, which overlap by whole pieces."""
+        chunks = []
+        # index of the first piece of the current chunk
+        first = 0
+        total = 0
+        for index, (piece_start, piece_end) in enumerate(pieces):
+            length = piece_end - piece_start
+            if total + length > self.chunk_size and index > first:
+                chunks.extend(self._join(pieces[first][0], pieces[index - 1][1]))
+                while total > self.chunk_overlap or (
+                    total + length > self.chunk_size and total > 0
+                ):
+                    total -= pieces[first][1] - pieces[first][0]
+                    first += 1
+            total += length
+        if first < len(pieces):
+            chunks.extend(self._join(pieces[first][0], pieces[-1][1]))
+        return chunks
@@ -1,57 +1,159 @@
+import asyncio
+import hashlib
+import json
+import logging
+import queue
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import PurePath
+from typing import Any, Iterable, Iterator
 
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
+import pypdf
 from langchain_core.documents import Document
-from qdrant_client.models import FieldCondition, Filter, MatchValue
-from vector_database.session import inc_vector_store
+from qdrant_client.models import (
+    DeleteOperation,
+    FieldCondition,
+    Filter,
+    Fusion,
+    FusionQuery,
+    MatchValue,
+    PointIdsList,
+    PointStruct,
+    Prefetch,
+    QuantizationSearchParams,
+    QueryRequest,
+    SearchParams,
+    SetPayload,
+    SetPayloadOperation,
+)
+from qdrant_client.models import SparseVector as QdrantSparseVector
+
+from cache import answers as answer_cache
+from cache import documents as parse_cache
+from cache import retrieval as retrieval_cache
+from cache import semantic as semantic_answer_cache
+from metrics import RSSSampler, metrics
+from settings import settings
+from vector_database.chunking import TreatyChunker
+from vector_database.pdf import PAGES_DELIMITER, iter_pages, iter_pdf_pages, read_file
+from vector_database.session import (
+    get_client,
+    get_inc_vector_store,
+    sparse_embeddings,
+)
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+# Namespace of the deterministic point ids derived from retriever id and chunk hash
+POINT_ID_NAMESPACE = uuid.UUID("5f0c7f5e-2b0e-4d8a-9a47-3c1f6f0a9e21")
+SCROLL_LIMIT = 10_000
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 100  # Reduced to 20% (more efficient, still good context)
+# characters of the pages which are collected before they are split
+SPLIT_BUFFER_SIZE = 10 * CHUNK_SIZE
+# part of the keys of the parse cache, increase it when the text or the chunks of a
+# file change, e.g. with a new extraction or chunking
+PARSER_VERSION = (
+    f"1:pypdf-{pypdf.__version__}:chunk_size-{CHUNK_SIZE}:overlap-{CHUNK_OVERLAP}"
+)
 
 
 def parse_file(file_path: str | PurePath) -> Document:
-    loader = PyPDFLoader(
-        file_path=file_path,
-        mode="single",
-    )
-    document = loader.load()
-    return document[0]
+    return Document(page_content=PAGES_DELIMITER.join(iter_pages(file_path)))
 
 
-def add_metadata(document: Document, doc_id: str, href: str) -> Document:
-    document.metadata = {}
-    document.metadata.update({"retriever_id": doc_id, "href": href})
+def document_metadata(
+    doc_id: str,
+    href: str,
+    session: str | None = None,
+    author_ids: list[str] | None = None,
+    topic_ids: list[str] | None = None,
+    document_type: str | None = None,
+) -> dict[str, Any]:
+    return {
+        "retriever_id": doc_id,
+        "href": href,
+        # indexed payload fields, see `SubmissionFilterIn`
+        "session": session,
+        "author_ids": author_ids or [],
+        "topic_ids": topic_ids or [],
+        "document_type": document_type,
+    }
+
+
+def add_metadata(
+    document: Document,
+    doc_id: str,
+    href: str,
+    session: str | None = None,
+    author_ids: list[str] | None = None,
+    topic_ids: list[str] | None = None,
+    document_type: str | None = None,
+) -> Document:
+    document.metadata = document_metadata(
+        doc_id=doc_id,
+        href=href,
+        session=session,
+        author_ids=author_ids,
+        topic_ids=topic_ids,
+        document_type=document_type,
+    )
     return document
 
 
+def text_splitter() -> TreatyChunker:
+    return TreatyChunker(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
 def split_document(document: Document) -> list[Document]:
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=2000,
-        chunk_overlap=100,  # Reduced to 20% (more efficient, still good context)
-        add_start_index=True,
-        strip_whitespace=True,
-        separators=[
-            # Structural separators (try these first)
-            "\n\nArticle ",
-            "\n\nChapter ",
-            "\n\nSection ",
-            "\n\n\n",  # Triple line breaks (major sections)
-            # Numbered items
-            "\n\n",  # Double line breaks (paragraphs)
-            r"\n\n(?=\d+\.)",  # Before numbered paragraphs (1. 2. 3.)
-            r"\n(?=\([0-9]+\))",  # Before parenthetical numbers (1) (2) (3)
-            r"\n(?=\([a-z]\))",  # Before lettered items (a) (b) (c)
-            # Your existing fallbacks
-            "\n",  # Single line breaks
-            ". ",  # Sentence endings
-            " ",  # Word boundaries
-            "",  # Character level (last resort)
-        ],
-        is_separator_regex=True,  # Enable regex patterns
+    docs_chunked = text_splitter().create_documents(
+        document.page_content, document.metadata
     )
-
-    docs_chunked = text_splitter.split_documents(documents=[document])
     return docs_chunked
 
 
+def split_pages(pages: Iterable[str], metadata: dict[str, Any]) -> Iterator[Document]:
+    """Split the text of a document while its pages are extracted.
+
+    The pages are joined like in `parse_file` into a buffer, which is split once it
+    exceeds `SPLIT_BUFFER_SIZE`. All chunks but the last are yielded, the last one
+    may continue on the next pages and stays in the buffer.
+
+    Parameters
+    ----------
+    pages : Iterable[str]
+        The text of the pages, see `vector_database.pdf.iter_pages`.
+    metadata : dict[str, Any]
+        The metadata of the document, copied into every chunk.
+
+    Yields
+    ------
+    Document
+        The chunks, whose `start_index` is the offset in the text of the document.
+    """
+    splitter = text_splitter()
+    buffer = ""
+    # offset of the buffer in the text of the document
+    offset = 0
+
+    def split_buffer() -> list[Document]:
+        return splitter.create_documents(buffer, metadata, offset=offset)
+
+    for number, page in enumerate(pages):
+        buffer += (PAGES_DELIMITER if number else "") + page
+        if len(buffer) < SPLIT_BUFFER_SIZE:
+            continue
+        *chunks, last = split_buffer()
+        yield from chunks
+        buffer = buffer[last.metadata["start_index"] - offset :]
+        offset = last.metadata["start_index"]
+    yield from split_buffer()
+
+
 def enrich_doc_chunks(doc_chunks: list[Document]) -> list[Document]:
     for doc in doc_chunks:
         content = doc.page_content
@@ -69,24 +171,489 @@ def enrich_doc_chunks(doc_chunks: list[Document]) -> list[Document]:
     return doc_chunks
 
 
-def upsert_doc_chunks(doc_id: str, doc_chunks: list[Document]) -> None:
-    delete_filter = Filter(
+def chunk_hash(doc: Document) -> str:
+    """Hash of what is embedded for a chunk, i.e. its content at its position.
+
+    The metadata is left out, so that changes of it are applied to the existing points
+    without embedding them again.
+    """
+    serialized = json.dumps(
+        {
+            "page_content": doc.page_content,
+            "start_index": doc.metadata.get("start_index"),
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+def point_id(doc_id: str, doc: Document) -> str:
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{doc_id}:{chunk_hash(doc)}"))
+
+
+def existing_points(
+    doc_id: str, collection_name: str = settings.vector_store.collection
+) -> dict[str, dict]:
+    """Metadata of all points of a document by their ids, usually fetched with a
+    single scroll request."""
+    scroll_filter = Filter(
         must=[
             FieldCondition(key="metadata.retriever_id", match=MatchValue(value=doc_id))
         ]
     )
-    inc_vector_store.client.delete(collection_name="inc", points_selector=delete_filter)
-    inc_vector_store.add_documents(doc_chunks)
+    points_metadata: dict[str, dict] = {}
+    offset = None
+    while True:
+        points, offset = get_client().scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=SCROLL_LIMIT,
+            offset=offset,
+            with_payload=["metadata"],
+            with_vectors=False,
+        )
+        points_metadata.update(
+            (str(point.id), (point.payload or {}).get("metadata", {}))
+            for point in points
+        )
+        if offset is None:
+            return points_metadata
+
+
+def has_sparse_vectors(collection_name: str) -> bool:
+    """Whether the collection has the sparse vector of the hybrid search."""
+    sparse_vectors = (
+        get_client().get_collection(collection_name).config.params
+    ).sparse_vectors
+    return settings.vector_store.sparse.vector_name in (sparse_vectors or {})
+
+
+def _put(points_queue: queue.Queue, item: object, upload: Future) -> None:
+    # never block forever on a full queue if the upload has failed
+    while True:
+        try:
+            points_queue.put(item, timeout=1)
+            return
+        except queue.Full:
+            if upload.done():
+                upload.result()
+                return
+
+
+def embed_and_upload(
+    docs: list[Document],
+    ids: list[str],
+    collection_name: str = settings.vector_store.collection,
+) -> None:
+    """Embed documents in batches and upload them while the next batch is encoded.
+
+    The vectors of every batch of `encode_batch_size` documents are put into a
+    bounded queue, which a background thread drains into Qdrant's `upload_points`.
+    Thus the CPU bound encoding of a batch overlaps with the upload of the previous
+    ones, and large documents are uploaded with `upload_parallel` processes.
+
+    Parameters
+    ----------
+    docs : list[Document]
+        The documents to embed.
+    ids : list[str]
+        The point ids of the documents.
+    collection_name : str
+        The collection to upload the points to.
+    """
+    encode_batch_size = settings.vector_store.encode_batch_size
+    points_queue: queue.Queue = queue.Queue(maxsize=2 * encode_batch_size)
+    done = object()
+
+    def points() -> Iterator[PointStruct]:
+        while (point := points_queue.get()) is not done:
+            yield point
+
+    inc_vector_store = get_inc_vector_store()
+    sparse = has_sparse_vectors(collection_name)
+    sparse_vector_name = settings.vector_store.sparse.vector_name
+    start = time.perf_counter()
+    encode_seconds = 0.0
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload") as executor:
+        upload = executor.submit(
+            get_client().upload_points,
+            collection_name=collection_name,
+            points=points(),
+            batch_size=settings.vector_store.upload_batch_size,
+            # spawning upload processes only pays off for several upload batches
+            parallel=(
+                settings.vector_store.upload_parallel
+                if len(docs) > settings.vector_store.upload_batch_size
+                else 1
+            ),
+            wait=True,
+        )
+        try:
+            for batch_start in range(0, len(docs), encode_batch_size):
+                batch = docs[batch_start : batch_start + encode_batch_size]
+                encode_start = time.perf_counter()
+                texts = [doc.page_content for doc in batch]
+                vectors: list[Any] = inc_vector_store.embeddings.embed_documents(texts)
+                if sparse:
+                    vectors = [
+                        {
+                            # the name of the unnamed dense vector
+                            "": vector,
+                            sparse_vector_name: QdrantSparseVector(
+                                **sparse_vector.model_dump()
+                            ),
+                        }
+                        for vector, sparse_vector in zip(
+                            vectors, sparse_embeddings.embed_documents(texts)
+                        )
+                    ]
+                encode_seconds += time.perf_counter() - encode_start
+                for id, doc, vector in zip(
+                    ids[batch_start : batch_start + encode_batch_size], batch, vectors
+                ):
+                    _put(
+                        points_queue,
+                        PointStruct(
+                            id=id,
+                            vector=vector,
+                            payload={
+                                inc_vector_store.content_payload_key: doc.page_content,
+                                inc_vector_store.metadata_payload_key: doc.metadata,
+                            },
+                        ),
+                        upload,
+                    )
+        finally:
+            _put(points_queue, done, upload)
+        upload.result()
+
+    seconds = time.perf_counter() - start
+    logger.info(
+        f"Embedded and uploaded {len(docs)} chunks in {seconds:.2f}s "
+        f"({len(docs) / seconds if seconds else 0:.1f} chunks/s, "
+        f"{encode_seconds:.2f}s encoding)."
+    )
+
+
+def visible_filter(filter: Filter | None = None) -> Filter:
+    """Restrict a filter to the points of completely written document versions."""
+    staged = FieldCondition(key="metadata.staged", match=MatchValue(value=True))
+    if filter is None:
+        return Filter(must_not=[staged])
+    must_not = filter.must_not or []
+    if not isinstance(must_not, list):
+        must_not = [must_not]
+    return filter.model_copy(update={"must_not": [*must_not, staged]})
+
+
+def search_params() -> SearchParams:
+    """Search-time HNSW and quantization parameters of the vector store settings."""
+    quantization = settings.vector_store.quantization
+    return SearchParams(
+        hnsw_ef=settings.vector_store.hnsw.ef,
+        quantization=(
+            QuantizationSearchParams(
+                rescore=quantization.rescore,
+                oversampling=quantization.oversampling,
+            )
+            if quantization.type != "none"
+            else None
+        ),
+    )
+
+
+def _query_request(
+    embedding: list[float], query: str, k: int, filter: Filter
+) -> QueryRequest:
+    if not settings.vector_store.sparse.hybrid_search:
+        return QueryRequest(
+            query=embedding,
+            filter=filter,
+            params=search_params(),
+            limit=k,
+            with_payload=True,
+        )
+
+    sparse_vector = sparse_embeddings.embed_query(query)
+    prefetch_limit = max(k, settings.vector_store.sparse.prefetch_limit)
+    return QueryRequest(
+        prefetch=[
+            Prefetch(
+                query=embedding,
+                filter=filter,
+                params=search_params(),
+                limit=prefetch_limit,
+            ),
+            Prefetch(
+                query=QdrantSparseVector(**sparse_vector.model_dump()),
+                using=settings.vector_store.sparse.vector_name,
+                filter=filter,
+                limit=prefetch_limit,
+            ),
+        ],
+        # reciprocal rank fusion of both result lists by the Qdrant server
+        query=FusionQuery(fusion=Fusion.RRF),
+        limit=k,
+        with_payload=True,
+    )
+
+
+def search_batch_by_vector(
+    embeddings: list[list[float]],
+    queries: list[str],
+    k: int,
+    filter: Filter | None = None,
+) -> list[list[Document]]:
+    """Search the visible chunks for several queries with a single request.
+
+    The dense and the sparse search are fused if the hybrid search is enabled.
+
+    Parameters
+    ----------
+    embeddings : list[list[float]]
+        The dense embeddings of the queries.
+    queries : list[str]
+        The query texts, for the sparse embeddings.
+    k : int
+        The number of returned chunks per query.
+    filter : Filter | None
+        Restricts the search, in addition to `visible_filter`.
+
+    Returns
+    -------
+    list[list[Document]]
+        The chunks of every query, most relevant first.
+    """
+    inc_vector_store = get_inc_vector_store()
+    filter = visible_filter(filter)
+    responses = get_client().query_batch_points(
+        collection_name=settings.vector_store.collection,
+        requests=[
+            _query_request(embedding, query, k, filter)
+            for embedding, query in zip(embeddings, queries)
+        ],
+    )
+    return [
+        [
+            Document(
+                page_content=point.payload[inc_vector_store.content_payload_key],
+                metadata={
+                    **point.payload[inc_vector_store.metadata_payload_key],
+                    "_id": point.id,
+                    "_collection_name": settings.vector_store.collection,
+                },
+            )
+            for point in response.points
+            if point.payload
+        ]
+        for response in responses
+    ]
+
+
+def search_by_vector(
+    embedding: list[float], query: str, k: int, filter: Filter | None = None
+) -> list[Document]:
+    """Search the visible chunks, see `search_batch_by_vector`."""
+    return search_batch_by_vector([embedding], [query], k, filter)[0]
+
+
+async def asearch_by_vector(
+    embedding: list[float], query: str, k: int, filter: Filter | None = None
+) -> list[Document]:
+    return await asyncio.to_thread(search_by_vector, embedding, query, k, filter)
+
+
+async def asearch_batch_by_vector(
+    embeddings: list[list[float]],
+    queries: list[str],
+    k: int,
+    filter: Filter | None = None,
+) -> list[list[Document]]:
+    return await asyncio.to_thread(
+        search_batch_by_vector, embeddings, queries, k, filter
+    )
+
+
+def upsert_doc_chunks(
+    doc_id: str,
+    doc_chunks: list[Document],
+    collection_name: str = settings.vector_store.collection,
+) -> None:
+    """Replace the points of a document with its chunks as a new version.
+
+    Points are identified by the retriever id and the hash of the chunk, so only
+    new or changed chunks are embedded and only removed chunks are deleted. Changed
+    metadata of the other chunks is set on their points in the batch update. New
+    points are written as staged, which hides them from `visible_filter`. Only after
+    all of them are acknowledged, a single batch update promotes the new version and
+    then deletes the outdated points, so readers never see an empty document or a
+    partially written version. The batch update is not transactional, readers may
+    still briefly see the promoted and the outdated points together. Staged points
+    of an interrupted upsert are reused or removed by the next one.
+
+    Parameters
+    ----------
+    doc_id : str
+        The retriever id of the document.
+    doc_chunks : list[Document]
+        The processed chunks of the document.
+    collection_name : str
+        The collection or alias to write to.
+    """
+    version = uuid.uuid4().hex
+    # identical chunks of a document are stored once
+    chunks_by_id = {point_id(doc_id, doc): doc for doc in doc_chunks}
+    existing = existing_points(doc_id, collection_name)
+
+    new_ids = [id for id in chunks_by_id if id not in existing]
+    removed_ids = [id for id in existing if id not in chunks_by_id]
+    # metadata changes of the unchanged points, grouped to share the requests
+    metadata_updates: dict[str, tuple[dict, list[str]]] = {}
+    for id, doc in chunks_by_id.items():
+        if id not in existing:
+            continue
+        changes = {
+            key: value
+            for key, value in doc.metadata.items()
+            if existing[id].get(key) != value
+        }
+        if changes:
+            serialized = json.dumps(changes, sort_keys=True)
+            metadata_updates.setdefault(serialized, (changes, []))[1].append(id)
+    updated_ids = [id for _, ids in metadata_updates.values() for id in ids]
+    # reused points staged by an interrupted upsert
+    staged_ids = [
+        id for id in chunks_by_id if existing.get(id, {}).get("staged", False)
+    ]
+
+    if new_ids:
+        embed_and_upload(
+            [
+                Document(
+                    page_content=chunks_by_id[id].page_content,
+                    metadata={
+                        **chunks_by_id[id].metadata,
+                        "version": version,
+                        "staged": True,
+                    },
+                )
+                for id in new_ids
+            ],
+            ids=new_ids,
+            collection_name=collection_name,
+        )
+
+    update_operations: list[SetPayloadOperation | DeleteOperation] = [
+        SetPayloadOperation(
+            set_payload=SetPayload(
+                payload=changes,
+                points=ids,  # type: ignore
+                key="metadata",
+            )
+        )
+        for changes, ids in metadata_updates.values()
+    ]
+    # without new, removed, updated or staged points the version stays as it is
+    if chunks_by_id and (new_ids or removed_ids or updated_ids or staged_ids):
+        update_operations.append(
+            SetPayloadOperation(
+                set_payload=SetPayload(
+                    payload={"version": version, "staged": False},
+                    points=list(chunks_by_id),  # type: ignore
+                    key="metadata",
+                )
+            )
+        )
+    if removed_ids:
+        update_operations.append(
+            DeleteOperation(delete=PointIdsList(points=removed_ids))  # type: ignore
+        )
+    if update_operations:
+        get_client().batch_update_points(
+            collection_name=collection_name,
+            update_operations=update_operations,
+            wait=True,
+        )
+    logger.info(
+        f"Document {doc_id} version {version} in {collection_name}: "
+        f"{len(new_ids)} chunks embedded, "
+        f"{len(removed_ids)} removed, "
+        f"{len(updated_ids)} with updated metadata, "
+        f"{len(chunks_by_id) - len(new_ids) - len(updated_ids)} unchanged."
+    )
+
+    if new_ids or removed_ids or updated_ids or staged_ids:
+        answer_cache.invalidate([doc_id])
+        semantic_answer_cache.invalidate([doc_id])
+        retrieval_cache.invalidate([doc_id])
 
 
 def process_document(
     file_path: str | PurePath,
     doc_id: str,
     href: str,
+    session: str | None = None,
+    author_ids: list[str] | None = None,
+    topic_ids: list[str] | None = None,
+    document_type: str | None = None,
 ) -> list[Document]:
-    document = parse_file(file_path=file_path)
-    document = add_metadata(document=document, doc_id=doc_id, href=href)
-    docs_chunked = split_document(document=document)
+    start = time.perf_counter()
+    metadata = document_metadata(
+        doc_id=doc_id,
+        href=href,
+        session=session,
+        author_ids=author_ids,
+        topic_ids=topic_ids,
+        document_type=document_type,
+    )
+    pdf_bytes = read_file(file_path)
+    cache_key = parse_cache.build_cache_key(pdf_bytes, PARSER_VERSION)
+    cached = parse_cache.get(cache_key)
+    if cached is not None:
+        metrics.increment("parse_cache.hits")
+        docs_chunked = [
+            Document(page_content=chunk, metadata={**metadata, "start_index": start})
+            for start, chunk in cached.chunks
+        ]
+        logger.info(
+            f"Document {doc_id} with {len(docs_chunked)} chunks found in the parse "
+            f"cache in {time.perf_counter() - start:.2f}s."
+        )
+        return enrich_doc_chunks(doc_chunks=docs_chunked)
+
+    metrics.increment("parse_cache.misses")
+    pages: list[str] = []
+
+    def collect_pages() -> Iterator[str]:
+        for page in iter_pdf_pages(pdf_bytes):
+            pages.append(page)
+            yield page
+
+    with RSSSampler() as rss_sampler:
+        docs_chunked = list(split_pages(collect_pages(), metadata=metadata))
+    elapsed = time.perf_counter() - start
+    metrics.observe("parsing.seconds", elapsed)
+    parse_cache.put(
+        cache_key,
+        parse_cache.ParsedDocument(
+            text=PAGES_DELIMITER.join(pages),
+            chunks=[
+                (doc.metadata["start_index"], doc.page_content) for doc in docs_chunked
+            ],
+        ),
+    )
+    # of this process only, the extraction pool of large files runs in other ones
+    rss_increase = rss_sampler.peak_increase
+    rss = (
+        ""
+        if rss_increase is None
+        else f", peak RSS increase {rss_increase / 2**20:.0f} MiB"
+    )
+    logger.info(
+        f"Document {doc_id} parsed into {len(docs_chunked)} chunks in "
+        f"{elapsed:.2f}s{rss}."
+    )
     docs_chunked = enrich_doc_chunks(doc_chunks=docs_chunked)
     return docs_chunked
 
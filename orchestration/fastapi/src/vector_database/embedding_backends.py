@@ -0,0 +1,192 @@
+"""Backends which run the dense embedding model on the CPU.
+
+The "torch" backend runs the sentence-transformers model in full precision with
+PyTorch. The "onnx" backend runs its transformer with ONNX Runtime instead, optionally
+with weights quantized to int8 for the instruction set of the CPU, while the pooling
+and the dense projection to the 512 dimensions of the collection stay the same. The
+vectors must stay close to the ones of PyTorch to share a collection with them:
+`benchmarks.embedding_backends` measures their drift and speed and records the drift
+in the report of `settings.vector_store.backend.drift_report`, and the "onnx" backend
+is only loaded when the report has it within the tolerance for the model.
+
+The ONNX models are exported once per host into the `export_dir` of the backend
+settings and loaded from there. The export needs `sentence-transformers[onnx]` of the
+optional "onnx" dependency group, which is imported only when the backend is used,
+like the model libraries in general.
+"""
+
+import json
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+class EmbeddingDriftError(RuntimeError):
+    """Raised when the drift of a backend is not known to be within the tolerance."""
+
+
+def variant_name(backend: str, quantization: str | None) -> str:
+    """Return the name of the backend and its quantization in the drift report."""
+    return backend if quantization is None else f"{backend}-{quantization}"
+
+
+def read_drift_report(path: Path) -> dict:
+    """Return the drift of the variants of every model, see
+    `benchmarks.embedding_backends`."""
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def check_drift(
+    model_name: str, backend: str, quantization: str | None, drift_report: Path
+) -> None:
+    """Raise an `EmbeddingDriftError` unless the report has the drift of the backend
+    within the tolerance for the model."""
+    variant = variant_name(backend, quantization)
+    drift = read_drift_report(drift_report).get(model_name, {}).get(variant)
+    if drift is None:
+        raise EmbeddingDriftError(
+            f"No drift of {variant} for {model_name} in {drift_report}, run "
+            "`python -m benchmarks.embedding_backends` first."
+        )
+    if not drift["within_tolerance"]:
+        raise EmbeddingDriftError(
+            f"The drift of {variant} for {model_name} is beyond the tolerance: {drift}"
+        )
+
+
+def quantize_onnx_model(onnx_dir: Path, quantization: str) -> None:
+    """Quantize the weights of the `model.onnx` in the directory dynamically to int8
+    into `model_quantized.onnx`, see `export_onnx_model`."""
+    # the quantized export of sentence-transformers 5.0 does not accept the models
+    # of the current optimum versions, so their quantizer is used directly
+    from optimum.onnxruntime import ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    quantizer = ORTQuantizer.from_pretrained(onnx_dir, file_name="model.onnx")
+    quantization_config = getattr(AutoQuantizationConfig, quantization)(is_static=False)
+    quantizer.quantize(quantization_config, onnx_dir, file_suffix="quantized")
+
+
+def export_onnx_model(
+    model_name: str, quantization: str | None, export_dir: Path
+) -> tuple[Path, str]:
+    """Export the model to ONNX, unless it is exported already.
+
+    Parameters
+    ----------
+    model_name : str
+        The sentence-transformers model.
+    quantization : str | None
+        The instruction set of the dynamic int8 quantization, one of "arm64", "avx2",
+        "avx512" and "avx512_vnni", or None for full precision.
+    export_dir : Path
+        The directory of the exported models.
+
+    Returns
+    -------
+    tuple[Path, str]
+        The directory of the exported model and the path of the ONNX file in it.
+    """
+    variant = "onnx" if quantization is None else f"onnx-qint8-{quantization}"
+    model_dir = export_dir / f"{model_name.replace('/', '--')}-{variant}"
+    file_name = (
+        "onnx/model.onnx" if quantization is None else "onnx/model_quantized.onnx"
+    )
+    if (model_dir / file_name).exists():
+        return model_dir, file_name
+
+    from sentence_transformers import SentenceTransformer
+
+    logger.info(f"Exporting {model_name} to ONNX ({variant}) into {model_dir}.")
+    export_dir.mkdir(parents=True, exist_ok=True)
+    # exported into a temporary directory first, other processes may export it too
+    tmp_dir = Path(tempfile.mkdtemp(dir=export_dir, prefix=".export-"))
+    try:
+        model = SentenceTransformer(model_name, backend="onnx", device="cpu")
+        model.save(str(tmp_dir))
+        if quantization is not None:
+            quantize_onnx_model(tmp_dir / "onnx", quantization)
+        try:
+            tmp_dir.rename(model_dir)
+        except OSError:
+            # exported by another process in the meantime
+            if not (model_dir / file_name).exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return model_dir, file_name
+
+
+def load_embeddings(
+    model_name: str,
+    backend: str = "torch",
+    quantization: str | None = None,
+    export_dir: Path | None = None,
+    drift_report: Path | None = None,
+) -> "HuggingFaceEmbeddings":
+    """Load the embedding model with a backend.
+
+    Parameters
+    ----------
+    model_name : str
+        The sentence-transformers model.
+    backend : str
+        "torch" or "onnx".
+    quantization : str | None
+        The dynamic int8 quantization of the "onnx" backend, see `export_onnx_model`.
+    export_dir : Path | None
+        The directory of the exported ONNX models, required by the "onnx" backend.
+    drift_report : Path | None
+        The drift report which must have the "onnx" backend within the tolerance.
+        None skips the check, only the benchmark which measures the drift does it.
+
+    Returns
+    -------
+    HuggingFaceEmbeddings
+        The embeddings, which run on the CPU.
+    """
+    # imports transformers, which takes seconds
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    if backend == "torch":
+        if quantization is not None:
+            logger.warning(f"Quantization {quantization} is ignored by PyTorch.")
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": "cpu"},
+        )
+    if backend == "onnx":
+        if export_dir is None:
+            raise ValueError("The onnx backend needs an export directory.")
+        if drift_report is not None:
+            check_drift(model_name, backend, quantization, drift_report)
+        try:
+            import onnxruntime  # noqa: F401
+            import optimum.onnxruntime  # noqa: F401
+        except ImportError as e:
+            raise ImportError(
+                "The onnx backend needs `poetry install --with onnx`."
+            ) from e
+        model_dir, file_name = export_onnx_model(model_name, quantization, export_dir)
+        return HuggingFaceEmbeddings(
+            model_name=str(model_dir),
+            model_kwargs={
+                "device": "cpu",
+                "backend": "onnx",
+                "model_kwargs": {"file_name": file_name},
+            },
+        )
+    raise ValueError(f"Unknown embedding backend {backend}.")
@@ -0,0 +1,99 @@
+"""Streaming text extraction of PDF files.
+
+The text of the pages is yielded one page at a time, so that the splitter can start
+before the whole file is extracted. The pages of large files are extracted by a pool
+of processes in ranges of consecutive pages and yielded in order. The text of a page
+is extracted like `PyPDFLoader` does it, hence the text of a file is the same as the
+one of `PyPDFLoader(mode="single")`, if the pages are joined with `PAGES_DELIMITER`.
+"""
+
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePath
+from typing import Iterator
+from urllib.parse import urlparse
+
+import httpx
+import pypdf
+
+from settings import settings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+# the default delimiter of the pages of `PyPDFLoader`
+PAGES_DELIMITER = "\n\f"
+
+
+def read_file(file_path: str | PurePath) -> bytes:
+    """Read a local file or download it, if the path is an URL."""
+    if urlparse(str(file_path)).scheme in ("http", "https"):
+        response = httpx.get(
+            str(file_path),
+            follow_redirects=True,
+            timeout=settings.pdf_parsing.download_timeout,
+        )
+        response.raise_for_status()
+        return response.content
+    return Path(file_path).read_bytes()
+
+
+def extract_page(page: pypdf.PageObject) -> str:
+    return page.extract_text(extraction_mode="plain").strip()
+
+
+def extract_pages(pdf_bytes: bytes, start: int, stop: int) -> list[str]:
+    """Extract the text of a range of pages, in a worker process of the pool."""
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    return [extract_page(reader.pages[number]) for number in range(start, stop)]
+
+
+def iter_pages(file_path: str | PurePath) -> Iterator[str]:
+    """Yield the text of every page of a PDF file, in order.
+
+    Parameters
+    ----------
+    file_path : str | PurePath
+        The path or URL of the file.
+
+    Yields
+    ------
+    str
+        The stripped text of a page.
+    """
+    yield from iter_pdf_pages(read_file(file_path))
+
+
+def iter_pdf_pages(pdf_bytes: bytes) -> Iterator[str]:
+    """Yield the text of every page of the content of a PDF file, in order."""
+    reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(reader.pages)
+    max_workers = min(settings.pdf_parsing.max_workers, os.cpu_count() or 1)
+    if page_count < settings.pdf_parsing.parallel_min_pages or max_workers <= 1:
+        for page in reader.pages:
+            yield extract_page(page)
+        return
+
+    pages_per_task = settings.pdf_parsing.pages_per_task
+    # spawned, forking a multi-threaded celery worker may deadlock
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = [
+            executor.submit(
+                extract_pages, pdf_bytes, start, min(start + pages_per_task, page_count)
+            )
+            for start in range(0, page_count, pages_per_task)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
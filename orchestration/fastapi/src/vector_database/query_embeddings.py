@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """Dispatcher which encodes concurrent embedding requests in batches.
+
+    Requests are collected for at most `max_wait_ms` milliseconds or until
+    `max_batch_size` texts are waiting. The batch is encoded with a single
+    `embed_documents` call in a background thread and the vectors are handed back to
+    the waiting callers, which may be threads or coroutines.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        The embedding model used to encode the batches.
+    max_batch_size : int
+        Maximum number of texts encoded in one batch.
+    max_wait_ms : float
+        Maximum time the first request of a batch waits for further requests.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, max_batch_size: int, max_wait_ms: float
+    ) -> None:
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: queue.Queue[tuple[str, Future]] = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        # started lazily, so that no thread is running before a worker forks
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="embedding-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed(self, text: str) -> list[float]:
+        return self.submit(text).result()
+
+    async def aembed(self, text: str) -> list[float]:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def _collect(self) -> list[tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = [
+                (text, future)
+                for text, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            if batch:
+                self._process(batch)
+
+    def _process(self, batch: list[tuple[str, Future]]) -> None:
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        start = time.perf_counter()
+        try:
+            vectors = self.embeddings.embed_documents(texts)
+        except Exception as e:
+            logger.error(f"Error encoding a batch of {len(texts)} texts: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        metrics.observe("embedding_batch.encode_seconds", time.perf_counter() - start)
+        metrics.increment("embedding_batch.batches")
+        metrics.increment("embedding_batch.texts", len(texts))
+        vectors_by_text = dict(zip(texts, vectors))
+        for text, future in batch:
+            future.set_result(list(vectors_by_text[text]))
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embedding model wrapper with an LRU cache for query embeddings.
+
+    Query embeddings are computed by an `EmbeddingBatcher`, so that the CPU bound
+    encoding never blocks the event loop of the API and concurrent queries are
+    encoded together.
+
+    Parameters
+    ----------
+    embeddings : Embeddings
+        The wrapped embedding model.
+    cache_size : int
+        Maximum number of cached query embeddings, keyed by the exact query text.
+    max_batch_size : int
+        Maximum number of queries encoded in one batch.
+    max_wait_ms : float
+        Maximum time a query waits for further queries to batch with.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_size: int,
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        self.embeddings = embeddings
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._batcher = EmbeddingBatcher(
+            embeddings=embeddings,
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms,
+        )
+
+    def _lookup(self, text: str) -> list[float] | None:
+        with self._lock:
+            vector = self._cache.get(text)
+            if vector is not None:
+                self._cache.move_to_end(text)
+        if vector is None:
+            metrics.increment("query_embedding.cache_misses")
+            return None
+        metrics.increment("query_embedding.cache_hits")
+        return list(vector)
+
+    def _store(self, text: str, vector: list[float]) -> None:
+        with self._lock:
+            self._cache[text] = vector
+            self._cache.move_to_end(text)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> list[float]:
+        vector = self._lookup(text)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = self._batcher.embed(text)
+        metrics.observe("query_embedding.encode_seconds", time.perf_counter() - start)
+        self._store(text, vector)
+        return list(vector)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        vector = self._lookup(text)
+        if vector is not None:
+            return vector
+        start = time.perf_counter()
+        vector = await self._batcher.aembed(text)
+        metrics.observe("query_embedding.encode_seconds", time.perf_counter() - start)
+        self._store(text, vector)
+        return list(vector)
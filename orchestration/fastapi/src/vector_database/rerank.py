@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from langchain_core.documents import Document
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+class CrossEncoderReranker:
+    """Reranks retrieved chunks with a local cross-encoder within a time budget.
+
+    The model is loaded by `warm_up` and scores one batch at a time in a dedicated
+    thread. If the scores are not ready within the budget, the chunks are returned in
+    their vector search order, so the reranking never delays an answer by more than
+    the budget. Without a warm up the first request loads the model in the background
+    and, like the requests until it is loaded, keeps the vector search order.
+
+    Parameters
+    ----------
+    model_name : str
+        The sentence-transformers cross-encoder, run on the CPU.
+    time_budget_ms : float
+        Maximum time spent waiting for the scores, including the queueing.
+    """
+
+    def __init__(self, model_name: str, time_budget_ms: float) -> None:
+        self.model_name = model_name
+        self.time_budget = time_budget_ms / 1000
+        self._model = None
+        self._lock = threading.Lock()
+        # a single thread, concurrent requests queue up and run out of budget instead
+        # of competing for the CPU
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._warm_up_future: Future | None = None
+
+    def _load_model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def warm_up(self) -> None:
+        """Load the model and score a pair, so that no request waits for them."""
+        start = time.perf_counter()
+        self._load_model().predict([("warm up", "warm up")])
+        logger.info(f"Reranker warmed up in {time.perf_counter() - start:.2f}s.")
+
+    def _is_warm(self) -> bool:
+        """Return whether the model is loaded, loading it in the background if not."""
+        if self._model is not None:
+            return True
+        metrics.increment("rerank.cold")
+
+        def warm_up() -> None:
+            try:
+                self.warm_up()
+            except Exception as e:
+                logger.error(f"Loading the reranker failed: {e}")
+
+        # on the thread of the scores, once, retried by a later request if it fails
+        if self._warm_up_future is None or self._warm_up_future.done():
+            self._warm_up_future = self._executor.submit(warm_up)
+        return False
+
+    def _score(self, query: str, docs: list[Document]) -> list[float]:
+        model = self._load_model()
+        return [
+            float(score)
+            for score in model.predict([(query, doc.page_content) for doc in docs])
+        ]
+
+    def order(
+        self, docs: list[Document], scores: list[float] | None, k: int
+    ) -> list[Document]:
+        """Return the `k` best scored chunks, the first `k` chunks without scores."""
+        if scores is None:
+            return docs[:k]
+        # a stable sort keeps the vector order of equally scored chunks
+        ranked = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        return [docs[i] for i in ranked[:k]]
+
+    def rerank(self, query: str, docs: list[Document], k: int) -> list[Document]:
+        """Return the `k` most relevant chunks, see `arerank`."""
+        if len(docs) <= 1 or not self._is_warm():
+            return docs[:k]
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, docs)
+        try:
+            scores = future.result(timeout=self.time_budget)
+        except FutureTimeoutError:
+            future.cancel()
+            metrics.increment("rerank.timeouts")
+            scores = None
+        except Exception as e:
+            logger.error(f"Reranking failed, falling back to the vector order: {e}")
+            metrics.increment("rerank.errors")
+            scores = None
+        metrics.observe("rerank.seconds", time.perf_counter() - start)
+        return self.order(docs, scores, k)
+
+    async def arerank(self, query: str, docs: list[Document], k: int) -> list[Document]:
+        """Return the `k` most relevant chunks.
+
+        Parameters
+        ----------
+        query : str
+            The question.
+        docs : list[Document]
+            The over-fetched chunks in vector search order.
+        k : int
+            The number of returned chunks.
+
+        Returns
+        -------
+        list[Document]
+            The chunks ordered by the cross-encoder, or the first `k` chunks in
+            vector search order if the budget is exceeded, the model is not loaded
+            yet or fails.
+        """
+        return self.order(docs, await self.ascores(query, docs), k)
+
+    async def ascores(self, query: str, docs: list[Document]) -> list[float] | None:
+        """Score the chunks within the time budget, see `arerank`.
+
+        Returns
+        -------
+        list[float] | None
+            The cross-encoder scores of the chunks, None if there is nothing to
+            rerank, the budget is exceeded, the model is not loaded yet or fails.
+        """
+        if len(docs) <= 1 or not self._is_warm():
+            return None
+        start = time.perf_counter()
+        future = self._executor.submit(self._score, query, docs)
+        try:
+            scores = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout=self.time_budget
+            )
+        except asyncio.TimeoutError:
+            metrics.increment("rerank.timeouts")
+            scores = None
+        except Exception as e:
+            logger.error(f"Reranking failed, falling back to the vector order: {e}")
+            metrics.increment("rerank.errors")
+            scores = None
+        metrics.observe("rerank.seconds", time.perf_counter() - start)
+        return scores
@@ -1,15 +1,50 @@
-from langchain_huggingface import HuggingFaceEmbeddings
+"""Clients and models of the vector database, created on first use.
+
+Importing this module neither loads the embedding model nor connects to Qdrant, so
+scripts and tools which never embed or search don't pay for them. The processes
+which do create them upfront with `warm_up`: the API in its lifespan and the celery
+workers when their process starts, see `tasks.resources`. Otherwise the first request
+or task creates them.
+"""
+
+import logging
+import threading
+import time
+
 from langchain_qdrant import QdrantVectorStore, RetrievalMode
 from qdrant_client import QdrantClient
+
 from settings import settings
+from vector_database.embedding_backends import load_embeddings
+from vector_database.query_embeddings import CachedQueryEmbeddings
+from vector_database.rerank import CrossEncoderReranker
+from vector_database.sparse import BM25SparseEmbeddings
+
+logger = logging.getLogger(__name__)
+logging.basicConfig(
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+# cheap to create, the reranker loads its model in `warm_up`
+sparse_embeddings = BM25SparseEmbeddings(
+    k1=settings.vector_store.sparse.k1,
+    b=settings.vector_store.sparse.b,
+    avg_doc_length=settings.vector_store.sparse.avg_doc_length,
+)
 
-embeddings = HuggingFaceEmbeddings(
-    model_name=settings.vector_store.model,
-    model_kwargs={"device": "cpu"},
+reranker = CrossEncoderReranker(
+    model_name=settings.rerank.model,
+    time_budget_ms=settings.rerank.time_budget_ms,
 )
 
+# reentrant, the vector store is created with the client and the embeddings
+_lock = threading.RLock()
+_embeddings: CachedQueryEmbeddings | None = None
+_client: QdrantClient | None = None
+_inc_vector_store: QdrantVectorStore | None = None
 
-def get_client():
+
+def create_client() -> QdrantClient:
     client = QdrantClient(
         url=settings.vector_store.url,
         api_key=settings.vector_store.api_key,  # not using Secret wrapper here
@@ -17,14 +52,64 @@ def get_client():
     return client
 
 
+def get_embeddings() -> CachedQueryEmbeddings:
+    """Return the dense embeddings of the process, loading the model on first use."""
+    global _embeddings
+    with _lock:
+        if _embeddings is None:
+            _embeddings = CachedQueryEmbeddings(
+                embeddings=load_embeddings(
+                    model_name=settings.vector_store.model,
+                    backend=settings.vector_store.backend.type,
+                    quantization=settings.vector_store.backend.quantization,
+                    export_dir=settings.vector_store.backend.export_dir,
+                    drift_report=settings.vector_store.backend.drift_report,
+                ),
+                cache_size=settings.vector_store.query_embedding_cache_size,
+                max_batch_size=settings.vector_store.embedding_batch_max_size,
+                max_wait_ms=settings.vector_store.embedding_batch_max_wait_ms,
+            )
+        return _embeddings
+
+
+def get_client() -> QdrantClient:
+    """Return the Qdrant client of the process."""
+    global _client
+    with _lock:
+        if _client is None:
+            _client = create_client()
+        return _client
+
+
 def vector_store(client: QdrantClient, collection_name: str) -> QdrantVectorStore:
     return QdrantVectorStore(
         client=client,
         collection_name=collection_name,
-        embedding=embeddings,
+        embedding=get_embeddings(),
         retrieval_mode=RetrievalMode.DENSE,
     )
 
 
-client = get_client()
-inc_vector_store = vector_store(client, "inc")
+def get_inc_vector_store() -> QdrantVectorStore:
+    """Return the vector store of the alias of the physical collection, see
+    `vector_database.aliases`."""
+    global _inc_vector_store
+    with _lock:
+        if _inc_vector_store is None:
+            _inc_vector_store = vector_store(
+                get_client(), settings.vector_store.collection
+            )
+        return _inc_vector_store
+
+
+def warm_up() -> None:
+    """Create the client and the vector store and load the embedding model and the
+    reranker if it is enabled."""
+    start = time.perf_counter()
+    get_inc_vector_store()
+    # the first encoding initializes the lazily loaded parts of the model
+    get_embeddings().embeddings.embed_query("warm up")
+    if settings.rerank.enabled:
+        # outside of the time budget of the requests
+        reranker.warm_up()
+    logger.info(f"Vector database warmed up in {time.perf_counter() - start:.2f}s.")
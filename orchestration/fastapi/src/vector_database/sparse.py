@@ -0,0 +1,74 @@
+"""Local sparse embeddings for the keyword part of the hybrid search.
+
+Texts are split into case folded word tokens and bigrams of adjacent tokens, which
+keeps references like "Article 6" together. Every token is hashed into the index
+space of a Qdrant sparse vector. Documents are weighted with the term frequency part
+of BM25, the inverse document frequency is applied by Qdrant through the IDF modifier
+of the sparse vector, so no vocabulary or model has to be fitted or downloaded.
+"""
+
+import hashlib
+import re
+import unicodedata
+from collections import Counter
+
+from langchain_qdrant import SparseEmbeddings, SparseVector
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> list[str]:
+    tokens = TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text).casefold())
+    bigrams = [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    return tokens + bigrams
+
+
+def token_index(token: str) -> int:
+    # a stable hash, unlike `hash`, which is salted per process
+    return int.from_bytes(
+        hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little"
+    )
+
+
+class BM25SparseEmbeddings(SparseEmbeddings):
+    """Hashed token sparse embeddings with BM25 term frequency saturation.
+
+    Parameters
+    ----------
+    k1 : float
+        Term frequency saturation of BM25.
+    b : float
+        Document length normalization of BM25.
+    avg_doc_length : float
+        Expected number of tokens of a chunk, including the bigrams.
+    """
+
+    def __init__(self, k1: float, b: float, avg_doc_length: float) -> None:
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    def _sparse_vector(self, weights: Counter[int]) -> SparseVector:
+        indices = sorted(weights)
+        return SparseVector(
+            indices=indices, values=[float(weights[index]) for index in indices]
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[SparseVector]:
+        vectors = []
+        for text in texts:
+            tokens = tokenize(text)
+            length_norm = 1 - self.b + self.b * len(tokens) / self.avg_doc_length
+            weights: Counter[int] = Counter()
+            for token, frequency in Counter(tokens).items():
+                # hash collisions of different tokens add up
+                weights[token_index(token)] += (
+                    frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+                )
+            vectors.append(self._sparse_vector(weights))
+        return vectors
+
+    def embed_query(self, text: str) -> SparseVector:
+        return self._sparse_vector(
+            Counter(token_index(token) for token in set(tokenize(text)))
+        )
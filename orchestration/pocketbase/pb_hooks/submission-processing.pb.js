@@ -117,6 +117,9 @@ onRecordUpdateRequest((e) => {
             ? articleKeyElementDict
             : null,
         session: session,
+        author_ids: e.record.get("author"),
+        topic_ids: e.record.get("topic"),
+        document_type: e.record.get("document_type"),
       }),
     });
 
@@ -210,6 +213,9 @@ onRecordAfterCreateSuccess((e) => {
             ? articleKeyElementDict
             : null,
         session: session,
+        author_ids: e.record.get("author"),
+        topic_ids: e.record.get("topic"),
+        document_type: e.record.get("document_type"),
       }),
     });
     if (response.statusCode < 200 || response.statusCode >= 300) {